@@ -1151,7 +1151,10 @@ class RmcContractAgreement(models.Model):
                 vals['name'] = self.env['ir.sequence'].next_by_code(
                     'rmc.contract.agreement'
                 ) or _('New')
-        agreements = super(RmcContractAgreement, self).create(vals_list)
+        # Matrix lines created through the one2many would each refresh the
+        # totals; defer them to the single refresh below.
+        agreements = super(RmcContractAgreement, self.with_context(rmc_defer_matrix_totals=True)).create(vals_list)
+        agreements = agreements.with_env(self.env)
         agreements._ensure_clause_defaults()
         agreements._update_manpower_totals_from_matrix()
         return agreements
@@ -1160,7 +1163,8 @@ class RmcContractAgreement(models.Model):
         self._check_locked_records_for_write(vals)
         contract_type_changed = 'contract_type' in vals
         matrix_updated = 'manpower_matrix_ids' in vals
-        res = super().write(vals)
+        target = self.with_context(rmc_defer_matrix_totals=True) if matrix_updated else self
+        res = super(RmcContractAgreement, target).write(vals)
         if contract_type_changed:
             self._ensure_clause_defaults()
         if matrix_updated:
@@ -3,10 +3,12 @@ import logging
 from collections import defaultdict
 from datetime import datetime, timedelta
 
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import ValidationError
 from odoo.osv import expression
 
+from . import operation_common
+
 _logger = logging.getLogger(__name__)
 
 class RmcAttendanceCompliance(models.Model):
@@ -47,6 +49,15 @@ class RmcAttendanceCompliance(models.Model):
     notes = fields.Text(string='Notes')
     company_id = fields.Many2one('res.company', string='Company', default=lambda self: self.env.company)
 
+    def init(self):
+        super().init()
+        tools.create_index(
+            self.env.cr,
+            'rmc_attendance_compliance_agr_date_idx',
+            self._table,
+            ['agreement_id', 'date'],
+        )
+
     @api.depends('agreement_id.manpower_matrix_ids')
     def _compute_expected(self):
         for record in self:
@@ -95,7 +106,8 @@ class RmcAttendanceCompliance(models.Model):
         for record in self:
             if not record.agreement_id.is_signed():
                 record.state = 'pending_agreement'
-                record.message_post(body=_('Attendance pending agreement signature.'))
+                if not self.env.context.get('tracking_disable'):
+                    record.message_post(body=_('Attendance pending agreement signature.'))
                 record.agreement_id.activity_schedule('mail.mail_activity_data_todo', summary=_('Sign agreement'), note=_('Attendance %s waiting.') % record.name)
 
     @api.constrains('headcount_present')
@@ -110,8 +122,9 @@ class RmcAttendanceCompliance(models.Model):
     def _check_employee_assignment(self):
         for record in self:
             if record.agreement_id and record.agreement_id.driver_ids and record.employee_ids:
-                extra = record.employee_ids - record.agreement_id.driver_ids
-                if extra:
+                extra_ids = set(record.employee_ids.ids) - set(record.agreement_id.driver_ids.ids)
+                if extra_ids:
+                    extra = self.env['hr.employee'].browse(extra_ids)
                     raise ValidationError(_(
                         'Employees %s are not assigned to agreement %s.'
                     ) % (', '.join(extra.mapped('name')), record.agreement_id.name))
@@ -181,25 +194,6 @@ class RmcAttendanceCompliance(models.Model):
             start_date = end_date
         return start_date, end_date
 
-    @api.model
-    def _build_employee_agreement_map(self, employee_ids):
-        """Return a {employee_id: agreement} mapping."""
-        employee_ids = [eid for eid in set(employee_ids) if eid]
-        mapping = {}
-        if not employee_ids:
-            return mapping
-        Agreement = self.env['rmc.contract.agreement'].sudo()
-        agreements = Agreement.search([
-            '|',
-            ('manpower_matrix_ids.employee_id', 'in', employee_ids),
-            ('driver_ids', 'in', employee_ids)
-        ])
-        for agreement in agreements:
-            employees = (agreement.driver_ids | agreement.manpower_matrix_ids.mapped('employee_id')).filtered(lambda e: e and e.id in employee_ids)
-            for employee in employees:
-                mapping.setdefault(employee.id, agreement)
-        return mapping
-
     @api.model
     def _derive_documents_flag(self, employees):
         """Set documents_ok if each employee has an attachment on their profile."""
@@ -278,51 +272,73 @@ class RmcAttendanceCompliance(models.Model):
     @api.model
     def cron_sync_from_hr_attendance(self):
         """Daily cron that auto-creates attendance compliance entries."""
-        self = self.sudo()
+        self = self.sudo().with_context(
+            tracking_disable=True,
+            mail_create_nolog=True,
+            mail_notrack=True,
+            mail_create_nosubscribe=True,
+        )
         window = self._attendance_sync_window()
         if not window or not all(window):
             _logger.debug("Attendance auto-sync skipped: empty window %s", window)
             return
         start_date, end_date = window
-        Attendance = self.env['hr.attendance'].sudo()
-        attendances = Attendance.search(self._attendance_domain(start_date, end_date))
-        if not attendances:
+        # Group in the same timezone _localize_attendance_date would use so the
+        # day buckets match the per-row localisation.
+        Attendance = self.env['hr.attendance'].sudo().with_context(
+            tz=self.env.context.get('tz') or self.env.user.tz,
+        )
+        groups = Attendance._read_group(
+            expression.AND([
+                self._attendance_domain(start_date, end_date),
+                [('employee_id', '!=', False)],
+            ]),
+            groupby=['agreement_id', 'employee_id', 'check_in:day'],
+            aggregates=['check_in:min', 'check_out:max'],
+        )
+        if not groups:
             ICP = self.env['ir.config_parameter'].sudo()
             ICP.set_param(self._ATTENDANCE_SYNC_PARAM, fields.Date.to_string(end_date))
             _logger.info("Attendance auto-sync: no records between %s and %s", start_date, end_date)
             return
-        employee_ids = attendances.filtered(lambda a: not a.agreement_id).mapped('employee_id').ids
-        agreement_map = self._build_employee_agreement_map(employee_ids)
+        employee_ids = [employee.id for agreement, employee, _day, _ci, _co in groups if not agreement]
+        agreement_map = operation_common.build_employee_agreement_map(self.env, employee_ids)
         bucket = defaultdict(lambda: {
             'agreement': False,
             'employees': self.env['hr.employee'],
             'first_check_in': False,
             'last_check_out': False,
         })
-        for attendance in attendances:
-            employee = attendance.employee_id
-            if not employee:
+        for agreement, employee, day, first_check_in, last_check_out in groups:
+            agreement = agreement or agreement_map.get(employee.id)
+            if not agreement or not day:
                 continue
-            agreement = attendance.agreement_id or agreement_map.get(employee.id)
-            if not agreement:
-                continue
-            date_value = self._localize_attendance_date(attendance.check_in or attendance.check_out)
-            if not date_value:
-                continue
-            key = (agreement.id, date_value)
+            if isinstance(day, datetime):
+                day = day.date()
+            key = (agreement.id, day)
             bucket[key]['agreement'] = agreement
             bucket[key]['employees'] |= employee
-            if attendance.check_in:
+            if first_check_in:
                 first_ci = bucket[key]['first_check_in']
-                if not first_ci or attendance.check_in < first_ci:
-                    bucket[key]['first_check_in'] = attendance.check_in
-            if attendance.check_out:
+                if not first_ci or first_check_in < first_ci:
+                    bucket[key]['first_check_in'] = first_check_in
+            if last_check_out:
                 last_co = bucket[key]['last_check_out']
-                if not last_co or attendance.check_out > last_co:
-                    bucket[key]['last_check_out'] = attendance.check_out
-            # record employees for the target day/agreement
+                if not last_co or last_check_out > last_co:
+                    bucket[key]['last_check_out'] = last_check_out
         ctx = dict(self.env.context, rmc_attendance_skip_sync=True)
-        created = updated = 0
+        existing_map = {}
+        if bucket:
+            bucket_days = [day for _agreement_id, day in bucket]
+            existing = self.search([
+                ('agreement_id', 'in', list({agreement_id for agreement_id, _day in bucket})),
+                ('date', '>=', min(bucket_days)),
+                ('date', '<=', max(bucket_days)),
+            ])
+            for record in existing:
+                existing_map.setdefault((record.agreement_id.id, record.date), record)
+        to_create_list = []
+        to_update_map = {}
         for (agreement_id, day), payload in bucket.items():
             employees = payload['employees']
             if not employees:
@@ -339,17 +355,20 @@ class RmcAttendanceCompliance(models.Model):
                 'first_check_in': payload['first_check_in'],
                 'last_check_out': payload['last_check_out'],
             }
-            record = self.search([
-                ('agreement_id', '=', agreement_id),
-                ('date', '=', day),
-            ], limit=1)
+            record = existing_map.get((agreement_id, day))
             if record:
-                record.with_context(ctx).write(vals)
-                updated += 1
+                to_update_map[record.id] = vals
             else:
-                record = self.with_context(ctx).create(vals)
-                created += 1
-            record._auto_validate_from_sync()
+                to_create_list.append(vals)
+        Compliance = self.with_context(ctx)
+        new_records = Compliance.create(to_create_list) if to_create_list else self.browse()
+        updated_records = self.browse(list(to_update_map))
+        for record_id, vals in to_update_map.items():
+            # Check-in times and employee sets are specific to each record, so
+            # there is nothing to share between writes.
+            Compliance.browse(record_id).write(vals)
+        (new_records | updated_records)._auto_validate_from_sync()
+        created, updated = len(new_records), len(updated_records)
         self.env['ir.config_parameter'].sudo().set_param(self._ATTENDANCE_SYNC_PARAM, fields.Date.to_string(end_date))
         _logger.info(
             "Attendance auto-sync done for %s-%s (created=%s, updated=%s)",
@@ -13,6 +13,9 @@ class RmcBillingPrepareLog(models.Model):
     _inherit = ['mail.thread', 'mail.activity.mixin']
 
     _SUPPORT_ATTACHMENT_DESCRIPTION = 'rmc_billing_support'
+    _SNAPSHOT_WIZARD_DEFAULTS = [
+        'state', 'attach_attendance', 'attach_diesel', 'attach_maintenance', 'attach_breakdown',
+    ]
 
     name = fields.Char(string='Description', compute='_compute_name', store=True)
     agreement_id = fields.Many2one(
@@ -347,17 +350,14 @@ class RmcBillingPrepareLog(models.Model):
                 'attach_breakdown': log.attach_breakdown,
                 'notes': log.notes,
             }
-            wizard = Wizard.with_context(wizard_ctx).create(wizard_vals)
-            try:
-                wizard._sync_mgq_with_prime_output()
-                wizard._apply_attendance_proration()
-                wizard._compute_billing_amounts()
-                source_records = wizard._collect_source_records()
-                wizard.with_context(rmc_skip_log_autorefresh=True)._create_billing_log(
-                    log.bill_id, attachments=None, source_records=source_records
-                )
-            finally:
-                wizard.unlink()
+            wizard = Wizard.with_context(wizard_ctx).new(wizard_vals)
+            wizard._sync_mgq_with_prime_output()
+            wizard._apply_attendance_proration()
+            wizard._compute_billing_amounts()
+            source_records = wizard._collect_source_records()
+            wizard.with_context(rmc_skip_log_autorefresh=True)._create_billing_log(
+                log.bill_id, attachments=None, source_records=source_records
+            )
 
     def _sync_supporting_attachments(self, attachments=None, source_bill=None):
         """Ensure supporting PDFs live on the log record and chatter."""
@@ -492,11 +492,13 @@ class RmcBillingPrepareLog(models.Model):
     @api.model
     def _generate_log_for_period(self, agreement, period_start, period_end):
         Wizard = self.env['rmc.billing.prepare.wizard']
-        wizard = Wizard.create({
-            'agreement_id': agreement.id,
-            'period_start': period_start,
-            'period_end': period_end,
-        })
+        # In-memory wizard: only its computations are needed, never a stored row.
+        wizard = Wizard.new(dict(
+            Wizard.default_get(self._SNAPSHOT_WIZARD_DEFAULTS),
+            agreement_id=agreement.id,
+            period_start=period_start,
+            period_end=period_end,
+        ))
         wizard._sync_mgq_with_prime_output()
         wizard._apply_attendance_proration()
         wizard._compute_billing_amounts()
@@ -510,7 +512,6 @@ class RmcBillingPrepareLog(models.Model):
         }
         log = wizard._create_billing_log(self.env['account.move'], attachments, source_records)
         log.state = 'draft'
-        wizard.unlink()
         return log
 
     @api.model
@@ -566,11 +567,13 @@ class RmcBillingPrepareLog(models.Model):
     @api.model
     def _generate_log_for_period(self, agreement, period_start, period_end):
         Wizard = self.env['rmc.billing.prepare.wizard']
-        wizard = Wizard.create({
-            'agreement_id': agreement.id,
-            'period_start': period_start,
-            'period_end': period_end,
-        })
+        # In-memory wizard: only its computations are needed, never a stored row.
+        wizard = Wizard.new(dict(
+            Wizard.default_get(self._SNAPSHOT_WIZARD_DEFAULTS),
+            agreement_id=agreement.id,
+            period_start=period_start,
+            period_end=period_end,
+        ))
         wizard._sync_mgq_with_prime_output()
         wizard._apply_attendance_proration()
         wizard._compute_billing_amounts()
@@ -583,7 +586,6 @@ class RmcBillingPrepareLog(models.Model):
             'breakdown': False,
         }
         log = wizard._create_billing_log(self.env['account.move'], attachments, source_records)
-        wizard.unlink()
         return log
 
     @api.model
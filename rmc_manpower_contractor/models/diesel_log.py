@@ -3,25 +3,43 @@
 Diesel Log - Track fuel consumption and efficiency
 """
 import logging
+from collections import defaultdict
 from datetime import timedelta
 
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import ValidationError
 
+from . import operation_common, sequence_common
+
 _logger = logging.getLogger(__name__)
 
+
+def _safe_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
 class RmcDieselLog(models.Model):
     _name = 'rmc.diesel.log'
     _description = 'RMC Diesel Log'
     _inherit = ['mail.thread', 'mail.activity.mixin']
     _order = 'date desc, id desc'
     _DIESEL_SYNC_PARAM = 'rmc.diesel.log.last_sync'
+    _EFFICIENCY_SQL_THRESHOLD = 50
+    _FLEET_SYNC_FIELDS = (
+        'vehicle_id', 'opening_diesel', 'issue_diesel', 'quantity', 'closing_diesel',
+        'production_name', 'odometer_difference', 'current_odometer', 'last_odometer',
+        'date', 'write_date', 'create_date', 'name',
+    )
 
     name = fields.Char(
         string='Reference',
         required=True,
         copy=False,
         readonly=True,
+        index=True,
         default=lambda self: _('New')
     )
     agreement_id = fields.Many2one(
@@ -114,20 +132,20 @@ class RmcDieselLog(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         """Generate sequence and check agreement signature"""
+        names = iter(sequence_common.next_sequence_names(self.env, 'rmc.diesel.log', sum(
+            1 for vals in vals_list if vals.get('name', _('New')) == _('New')
+        )))
         for vals in vals_list:
             agreement_id = vals.get('agreement_id')
             if agreement_id:
                 self.env['rmc.contract.agreement'].browse(agreement_id)._check_closure_operation_allowed(_('create diesel logs'))
             if vals.get('name', _('New')) == _('New'):
-                vals['name'] = self.env['ir.sequence'].next_by_code(
-                    'rmc.diesel.log'
-                ) or _('New')
+                vals['name'] = next(names)
 
         records = super(RmcDieselLog, self).create(vals_list)
-        for record in records:
-            record._check_agreement_signature()
-            record._validate_agreement_assignments()
-            record._default_assignments_from_agreement()
+        records._check_agreement_signature()
+        records._validate_agreement_assignments()
+        records._default_assignments_from_agreement()
         return records
 
     def write(self, vals):
@@ -159,49 +177,85 @@ class RmcDieselLog(models.Model):
         If agreement is not signed, set state to pending_agreement
         and create activity
         """
+        agr_signed = {agreement.id: agreement.is_signed() for agreement in self.mapped('agreement_id')}
+        pending_by_agreement = defaultdict(lambda: self.browse())
         for record in self:
-            if not record.agreement_id.is_signed():
+            if not agr_signed.get(record.agreement_id.id, False):
                 record.state = 'pending_agreement'
                 record.message_post(
                     body=_('Diesel log is pending because agreement is not signed yet.'),
                     subject=_('Pending Agreement Signature')
                 )
-                # Create activity for agreement owner
-                record.agreement_id.activity_schedule(
-                    'mail.mail_activity_data_todo',
-                    summary=_('Sign agreement to validate diesel logs'),
-                    note=_('Diesel log %s is waiting for agreement signature.') % record.name
-                )
+                pending_by_agreement[record.agreement_id] |= record
+        # Create one activity per agreement owner listing every pending log
+        for agreement, pending in pending_by_agreement.items():
+            agreement.activity_schedule(
+                'mail.mail_activity_data_todo',
+                summary=_('Sign agreement to validate diesel logs'),
+                note=_('Diesel logs waiting for signature: %s') % ', '.join(pending.mapped('name'))
+            )
 
     def _validate_agreement_assignments(self):
         """
         Ensure selected vehicle/driver belong to the agreement configuration
         """
+        lookup = {
+            agreement.id: (frozenset(agreement.vehicle_ids._ids), frozenset(agreement.driver_ids._ids))
+            for agreement in self.mapped('agreement_id')
+        }
         for record in self:
             if record.agreement_id:
-                if record.vehicle_id and record.vehicle_id not in record.agreement_id.vehicle_ids:
+                vehicle_ids, driver_ids = lookup[record.agreement_id.id]
+                if record.vehicle_id and record.vehicle_id.id not in vehicle_ids:
                     raise ValidationError(
                         _('Vehicle %s is not assigned to agreement %s.') %
                         (record.vehicle_id.display_name, record.agreement_id.name)
                     )
-                if record.driver_id and record.driver_id not in record.agreement_id.driver_ids:
+                if record.driver_id and record.driver_id.id not in driver_ids:
                     raise ValidationError(
                         _('Driver %s is not assigned to agreement %s.') %
                         (record.driver_id.name, record.agreement_id.name)
                     )
 
     def _default_assignments_from_agreement(self):
+        firsts = {
+            agreement.id: (agreement.vehicle_ids[:1].id, agreement.driver_ids[:1].id)
+            for agreement in self.mapped('agreement_id')
+        }
         for record in self:
-            if not record.agreement_id:
+            if not record.agreement_id or (record.vehicle_id and record.driver_id):
                 continue
-            if not record.vehicle_id and record.agreement_id.vehicle_ids:
-                record.vehicle_id = record.agreement_id.vehicle_ids[:1]
-            if not record.driver_id and record.agreement_id.driver_ids:
-                record.driver_id = record.agreement_id.driver_ids[:1]
+            first_vehicle_id, first_driver_id = firsts[record.agreement_id.id]
+            if not record.vehicle_id and first_vehicle_id:
+                record.vehicle_id = first_vehicle_id
+            if not record.driver_id and first_driver_id:
+                record.driver_id = first_driver_id
 
     @api.depends('issued_ltr', 'work_done_m3', 'work_done_km')
     def _compute_efficiency(self):
         """Calculate diesel efficiency based on work done"""
+        if len(self) > self._EFFICIENCY_SQL_THRESHOLD and all(self._ids):
+            # Bulk recomputes (fleet sync) run as one set-based UPDATE, rounded
+            # like the ORM rounds the field's digits=(5, 2) on the per-record path.
+            self.flush_recordset(['issued_ltr', 'work_done_m3', 'work_done_km'])
+            self.env.cr.execute("""
+                UPDATE rmc_diesel_log
+                   SET diesel_efficiency = CASE
+                           WHEN issued_ltr <= 0 THEN 0
+                           WHEN work_done_m3 > 0 THEN ROUND(work_done_m3 / issued_ltr, 2)
+                           WHEN work_done_km > 0 THEN ROUND(work_done_km / issued_ltr, 2)
+                           ELSE 0
+                       END,
+                       efficiency_unit = CASE
+                           WHEN issued_ltr <= 0 THEN ''
+                           WHEN work_done_m3 > 0 THEN 'm³/liter'
+                           WHEN work_done_km > 0 THEN 'km/liter'
+                           ELSE ''
+                       END
+                 WHERE id = ANY(%s)
+            """, [list(self.ids)])
+            self.invalidate_recordset(['diesel_efficiency', 'efficiency_unit'])
+            return
         for record in self:
             if record.issued_ltr > 0:
                 if record.work_done_m3 > 0:
@@ -217,24 +271,11 @@ class RmcDieselLog(models.Model):
                 record.diesel_efficiency = 0.0
                 record.efficiency_unit = ''
 
-    @api.constrains('opening_ltr', 'issued_ltr', 'closing_ltr')
-    def _check_positive_liters(self):
-        """Ensure non-negative liter values"""
-        for record in self:
-            if record.opening_ltr < 0 or record.issued_ltr < 0 or record.closing_ltr < 0:
-                raise ValidationError(_('Liter values cannot be negative.'))
-
-    @api.constrains('work_done_m3', 'work_done_km')
-    def _check_positive_work(self):
-        """Ensure non-negative work values"""
-        for record in self:
-            if record.work_done_m3 < 0 or record.work_done_km < 0:
-                raise ValidationError(_('Work done values cannot be negative.'))
-
     def action_validate(self):
         """Validate diesel log"""
+        agr_signed = {agreement.id: agreement.is_signed() for agreement in self.mapped('agreement_id')}
         for record in self:
-            if not record.agreement_id.is_signed():
+            if not agr_signed.get(record.agreement_id.id, False):
                 raise ValidationError(
                     _('Cannot validate: Agreement %s is not signed yet.') % 
                     record.agreement_id.name
@@ -251,51 +292,77 @@ class RmcDieselLog(models.Model):
     # ------------------------------------------------------------------
 
     @api.model
-    def _resolve_agreement_for_vehicle(self, vehicle):
-        if not vehicle:
-            return self.env['rmc.contract.agreement']
+    def _build_vehicle_agreement_map(self, vehicles):
+        """Return a {vehicle_id: agreement} mapping."""
+        mapping = {}
+        vehicle_ids = set(vehicles.ids)
+        if not vehicle_ids:
+            return mapping
         Agreement = self.env['rmc.contract.agreement'].sudo()
-        domain = [
+        agreements = Agreement.search([
             '|',
-            ('vehicle_ids', 'in', vehicle.ids),
-            ('manpower_matrix_ids.vehicle_id', 'in', vehicle.ids)
-        ]
-        return Agreement.search(domain, limit=1)
+            ('vehicle_ids', 'in', list(vehicle_ids)),
+            ('manpower_matrix_ids.vehicle_id', 'in', list(vehicle_ids))
+        ])
+        for agreement in agreements:
+            for vehicle in agreement.vehicle_ids | agreement.manpower_matrix_ids.mapped('vehicle_id'):
+                if vehicle.id in vehicle_ids:
+                    mapping.setdefault(vehicle.id, agreement)
+        return mapping
+
+    @api.model
+    def _build_driver_employee_map(self, vehicles):
+        """Return a {driver_partner_id: employee} mapping."""
+        mapping = {}
+        partner_ids = vehicles.mapped('driver_id').ids
+        if not partner_ids:
+            return mapping
+        employees = self.env['hr.employee'].sudo().search([
+            ('address_home_id', 'in', partner_ids)
+        ])
+        for employee in employees:
+            mapping.setdefault(employee.address_home_id.id, employee)
+        return mapping
 
     @api.model
-    def _resolve_driver_employee(self, vehicle, agreement):
+    def _resolve_driver_employee(self, vehicle, agreement, emp_by_partner=None):
         Employee = self.env['hr.employee'].sudo()
         if not vehicle or not vehicle.driver_id:
             return Employee
-        employee = Employee.search([
-            ('address_home_id', '=', vehicle.driver_id.id)
-        ], limit=1)
-        if employee and agreement.driver_ids and employee not in agreement.driver_ids:
+        if emp_by_partner is None:
+            emp_by_partner = self._build_driver_employee_map(vehicle)
+        employee = emp_by_partner.get(vehicle.driver_id.id, Employee)
+        if employee and agreement.driver_ids and employee.id not in frozenset(agreement.driver_ids._ids):
             return Employee.browse()
         return employee
 
     @api.model
-    def _extract_work_payload(self, log):
-        work_m3 = 0.0
-        work_km = 0.0
-        production_name = getattr(log, 'production_name', False)
-        if production_name:
-            try:
-                value = float(production_name)
-            except (TypeError, ValueError):
-                value = 0.0
-            if value > 0:
-                work_m3 = value
-        odometer_diff = getattr(log, 'odometer_difference', False)
-        if odometer_diff:
-            work_km = odometer_diff
-        elif getattr(log, 'current_odometer', False) and getattr(log, 'last_odometer', False):
-            work_km = (log.current_odometer or 0.0) - (log.last_odometer or 0.0)
-        return work_m3, work_km
+    def _extract_work_payloads(self, logs):
+        """Return {log_id: (work_m3, work_km)} for a batch of fleet diesel logs."""
+        # diesel.log comes from another module: resolve optional fields once
+        # per batch instead of probing each record with getattr().
+        has_production = 'production_name' in logs._fields
+        has_difference = 'odometer_difference' in logs._fields
+        has_odometers = 'current_odometer' in logs._fields and 'last_odometer' in logs._fields
+        payloads = {}
+        for log in logs:
+            work_m3 = 0.0
+            work_km = 0.0
+            if has_production and log.production_name:
+                work_m3 = max(_safe_float(log.production_name), 0.0)
+            odometer_diff = log.odometer_difference if has_difference else False
+            if odometer_diff:
+                work_km = odometer_diff
+            elif has_odometers and log.current_odometer and log.last_odometer:
+                work_km = log.current_odometer - log.last_odometer
+            payloads[log.id] = (work_m3, work_km)
+        return payloads
 
     @api.model
-    def _prepare_sync_vals(self, log, agreement):
-        work_m3, work_km = self._extract_work_payload(log)
+    def _prepare_sync_vals(self, log, agreement, emp_by_partner=None, work_payloads=None):
+        if work_payloads is None:
+            work_payloads = self._extract_work_payloads(log)
+        work_m3, work_km = work_payloads[log.id]
         date_value = fields.Date.to_date(log.date) if log.date else fields.Date.context_today(self)
         vals = {
             'agreement_id': agreement.id,
@@ -307,30 +374,28 @@ class RmcDieselLog(models.Model):
             'work_done_m3': work_m3,
             'work_done_km': work_km,
         }
-        driver = self._resolve_driver_employee(log.vehicle_id, agreement)
+        driver = self._resolve_driver_employee(log.vehicle_id, agreement, emp_by_partner)
         if driver:
             vals['driver_id'] = driver.id
         # Allow zero-quantity logs to sync as well so Operations view mirrors
         # everything captured in the fleet module (some audit logs have Qty = 0).
         return vals
 
-    def _upsert_from_diesel_log(self, log, agreement):
-        vals = self._prepare_sync_vals(log, agreement)
-        if not vals:
-            return False
-        sync_name = f"SYNC-DL-{log.id}"
-        record = self.search([('name', '=', sync_name)], limit=1)
-        if record:
-            record.write(vals)
-            return record
-        vals['name'] = sync_name
+    @api.model
+    def _prepare_sync_create_vals(self, log, vals):
+        vals['name'] = f"SYNC-DL-{log.id}"
         vals.setdefault('notes', _('Auto-synced from diesel log %s') % (log.name or log.id))
-        return self.create(vals)
+        return vals
 
     @api.model
     def cron_sync_from_fleet_issues(self):
         """Mirror approved/done diesel.log entries into RMC diesel log."""
-        self = self.sudo()
+        self = self.sudo().with_context(
+            tracking_disable=True,
+            mail_create_nolog=True,
+            mail_notrack=True,
+            mail_create_nosubscribe=True,
+        )
         DieselLog = self.env['diesel.log'].sudo()
         ICP = self.env['ir.config_parameter'].sudo()
         last_sync_str = ICP.get_param(self._DIESEL_SYNC_PARAM)
@@ -340,32 +405,57 @@ class RmcDieselLog(models.Model):
             ('state', 'in', ('approved', 'done')),
         ]
         if last_sync:
-            domain.append(('write_date', '>', fields.Datetime.to_string(last_sync - timedelta(hours=1))))
+            domain.append(('write_date', '>', last_sync - timedelta(hours=1)))
         else:
-            baseline = fields.Datetime.from_string(fields.Datetime.now())
-            domain.append(('create_date', '>=', fields.Datetime.to_string(baseline - timedelta(days=7))))
+            domain.append(('create_date', '>=', fields.Datetime.now() - timedelta(days=7)))
         logs = DieselLog.search(domain, order='write_date asc, id asc')
         if not logs:
             return
-        latest = last_sync
-        processed = 0
+        # diesel.log comes from another module; only warm the fields it defines.
+        logs.fetch([fname for fname in self._FLEET_SYNC_FIELDS if fname in DieselLog._fields])
+        vehicles = logs.mapped('vehicle_id')
+        vehicles.fetch(['driver_id'])
+        agreement_map = self._build_vehicle_agreement_map(vehicles)
+        emp_by_partner = self._build_driver_employee_map(vehicles)
+        work_payloads = self._extract_work_payloads(logs)
+        existing_map = {}
+        for record in self.search([('name', 'in', [f"SYNC-DL-{log.id}" for log in logs])]):
+            existing_map.setdefault(record.name, record)
+        processed_logs = []
+        to_create = []
+        to_write = []
         for log in logs:
-            agreement = self._resolve_agreement_for_vehicle(log.vehicle_id)
+            agreement = agreement_map.get(log.vehicle_id.id)
             if not agreement:
                 continue
-            record = self._upsert_from_diesel_log(log, agreement)
-            if record:
-                processed += 1
-                timestamp = fields.Datetime.from_string(log.write_date) if log.write_date else False
-                if not timestamp and log.create_date:
-                    timestamp = fields.Datetime.from_string(log.create_date)
-                if timestamp:
-                    latest = timestamp if not latest else max(latest, timestamp)
+            vals = self._prepare_sync_vals(log, agreement, emp_by_partner, work_payloads)
+            if vals:
+                record = operation_common.match_existing(self, f"SYNC-DL-{log.id}", existing_map)
+                if record:
+                    to_write.append((record, vals))
+                else:
+                    to_create.append(self._prepare_sync_create_vals(log, vals))
+                processed_logs.append(log)
+        if to_create:
+            self.create(to_create)
+        # Records sharing an identical payload go through a single write.
+        for payload, items in tools.groupby(to_write, key=lambda item: frozenset(item[1].items())):
+            self.browse([record.id for record, _vals in items]).write(dict(payload))
+        # write_date/create_date are already datetime objects.
+        timestamps = [log.write_date or log.create_date for log in processed_logs]
+        latest = max(filter(None, timestamps + [last_sync]), default=None)
         if latest:
-            ICP.set_param(self._DIESEL_SYNC_PARAM, fields.Datetime.to_string(latest))
-        _logger.info("Diesel auto-sync processed %s fleet issues.", processed)
+            latest_str = fields.Datetime.to_string(latest)
+            if latest_str != last_sync_str:
+                ICP.set_param(self._DIESEL_SYNC_PARAM, latest_str)
+        _logger.info("Diesel auto-sync processed %s fleet issues.", len(processed_logs))
 
     _sql_constraints = [
+        (
+            'rmc_diesel_opening_ltr_positive',
+            'CHECK(opening_ltr >= 0)',
+            'Opening liters must be non-negative.'
+        ),
         (
             'rmc_diesel_closing_ltr_positive',
             'CHECK(closing_ltr >= 0)',
@@ -376,6 +466,16 @@ class RmcDieselLog(models.Model):
             'CHECK(issued_ltr >= 0)',
             'Issued liters must be non-negative.'
         ),
+        (
+            'rmc_diesel_work_done_m3_positive',
+            'CHECK(work_done_m3 >= 0)',
+            'Work done (m³) must be non-negative.'
+        ),
+        (
+            'rmc_diesel_work_done_km_positive',
+            'CHECK(work_done_km >= 0)',
+            'Distance traveled must be non-negative.'
+        ),
     ]
 
 
@@ -393,12 +493,22 @@ class DieselLog(models.Model):
 
     @api.depends('vehicle_id', 'vehicle_id.rmc_agreement_ids')
     def _compute_rmc_agreement(self):
+        vehicle_ids = [vid for vid in self.mapped('vehicle_id')._origin.ids if vid]
+        best_per_vehicle = {}
+        if vehicle_ids:
+            self.env['rmc.contract.agreement'].flush_model(['state', 'vehicle_ids'])
+            self.env.cr.execute("""
+                SELECT rel.vehicle_id, agr.id, agr.state
+                  FROM rmc_agreement_vehicle_rel rel
+                  JOIN rmc_contract_agreement agr ON agr.id = rel.agreement_id
+                 WHERE rel.vehicle_id = ANY(%s)
+            """, [vehicle_ids])
+            for vehicle_id, agreement_id, state in self.env.cr.fetchall():
+                # Prefer live agreements, then active ones, then the oldest id.
+                key = (state in ('cancelled', 'expired'), state != 'active', agreement_id)
+                current = best_per_vehicle.get(vehicle_id)
+                if current is None or key < current:
+                    best_per_vehicle[vehicle_id] = key
         for log in self:
-            agreement = False
-            vehicle = log.vehicle_id
-            if vehicle and vehicle.rmc_agreement_ids:
-                agreements = vehicle.rmc_agreement_ids
-                preferred = agreements.filtered(lambda agr: agr.state not in ('cancelled', 'expired'))
-                target = (preferred or agreements).sorted(key=lambda agr: (agr.state != 'active', agr.id))[:1]
-                agreement = target.id if target else False
-            log.rmc_agreement_id = agreement
+            best = best_per_vehicle.get(log.vehicle_id._origin.id)
+            log.rmc_agreement_id = best[2] if best else False
@@ -2,6 +2,8 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 
+from . import operation_common, sequence_common
+
 class RmcInventoryHandover(models.Model):
     _name = 'rmc.inventory.handover'
     _description = 'RMC Inventory Handover'
@@ -36,7 +38,7 @@ class RmcInventoryHandover(models.Model):
     picking_id = fields.Many2one('stock.picking', string='Inventory Request', readonly=True, copy=False)
     inventory_request_ref = fields.Char(string='Inventory Ref', related='picking_id.name', readonly=True)
     
-    currency_id = fields.Many2one('res.currency', string='Currency', default=lambda self: self.env.company.currency_id)
+    currency_id = fields.Many2one('res.currency', string='Currency', compute='_compute_currency_id')
     unit_price = fields.Monetary(string='Unit Price', currency_field='currency_id', help='Standard cost per unit')
     
     state = fields.Selection([('draft', 'Draft'), ('issued', 'Issued'), ('returned', 'Returned'), ('reconciled', 'Reconciled')], default='draft', required=True, tracking=True)
@@ -51,15 +53,23 @@ class RmcInventoryHandover(models.Model):
 
     @api.model_create_multi
     def create(self, vals_list):
+        names = iter(sequence_common.next_sequence_names(self.env, 'rmc.inventory.handover', sum(
+            1 for vals in vals_list if vals.get('name', _('New')) == _('New')
+        )))
         for vals in vals_list:
             if vals.get('name', _('New')) == _('New'):
-                vals['name'] = self.env['ir.sequence'].next_by_code('rmc.inventory.handover') or _('New')
+                vals['name'] = next(names)
         records = super(RmcInventoryHandover, self).create(vals_list)
         for record in records:
             record._validate_agreement_employee()
             record._default_employee_from_agreement()
         return records
 
+    @api.depends('company_id.currency_id')
+    def _compute_currency_id(self):
+        for record in self:
+            record.currency_id = record.company_id.currency_id or self.env.company.currency_id
+
     @api.depends('issued_qty', 'returned_qty', 'unit_price')
     def _compute_variance(self):
         for record in self:
@@ -95,32 +105,36 @@ class RmcInventoryHandover(models.Model):
         picking_type = self.env.ref('rmc_manpower_contractor.picking_type_contract_issue', raise_if_not_found=False)
         if not picking_type:
             raise ValidationError(_('Contract Issue Product picking type is not configured.'))
+        Picking = self.env['stock.picking']
+        pending = []
+        picking_vals_list = []
         for record in self:
             if record.picking_id:
                 continue
             if record.issued_qty <= 0:
                 raise ValidationError(_('Issued quantity must be greater than zero to create an inventory request.'))
-            move_qty = record.issued_qty
-            picking_vals = {
+            pending.append(record)
+            picking_vals_list.append({
                 'picking_type_id': picking_type.id,
                 'partner_id': record.contractor_id.id,
                 'origin': record.name,
                 'company_id': record.company_id.id,
-                'agreement_id': record.agreement_id.id if 'agreement_id' in self.env['stock.picking']._fields else False,
-            }
-            picking = self.env['stock.picking'].create(picking_vals)
-            move_vals = {
-                'name': record.item_id.display_name,
-                'product_id': record.item_id.id,
-                'product_uom_qty': move_qty,
-                'product_uom': record.uom_id.id,
-                'picking_id': picking.id,
-                'location_id': picking_type.default_location_src_id.id or picking.location_id.id,
-                'location_dest_id': picking_type.default_location_dest_id.id or picking.location_dest_id.id,
-            }
-            picking.move_ids_without_package = [(0, 0, move_vals)]
-            record.picking_id = picking.id
-            record.state = 'issued'
+                'agreement_id': record.agreement_id.id if 'agreement_id' in Picking._fields else False,
+            })
+        if not pending:
+            return True
+        pickings = Picking.create(picking_vals_list)
+        self.env['stock.move'].create([{
+            'name': record.item_id.display_name,
+            'product_id': record.item_id.id,
+            'product_uom_qty': record.issued_qty,
+            'product_uom': record.uom_id.id,
+            'picking_id': picking.id,
+            'location_id': picking_type.default_location_src_id.id or picking.location_id.id,
+            'location_dest_id': picking_type.default_location_dest_id.id or picking.location_dest_id.id,
+        } for record, picking in zip(pending, pickings)])
+        for record, picking in zip(pending, pickings):
+            record.write({'picking_id': picking.id, 'state': 'issued'})
         return True
 
     def action_open_inventory_request(self):
@@ -146,20 +160,20 @@ class RmcInventoryHandover(models.Model):
 
     @api.constrains('issued_qty', 'returned_qty')
     def _check_quantities(self):
+        driver_sets = operation_common.agreement_driver_sets(self)
         for record in self:
-            if record.issued_qty < 0:
-                raise ValidationError(_('Issued quantity cannot be negative.'))
-            if record.returned_qty < 0:
-                raise ValidationError(_('Returned quantity cannot be negative.'))
-            if record.employee_id and record.agreement_id.driver_ids and record.employee_id not in record.agreement_id.driver_ids:
+            driver_ids = driver_sets.get(record.agreement_id.id)
+            if record.employee_id and driver_ids and record.employee_id.id not in driver_ids:
                 raise ValidationError(
                     _('Employee %s is not assigned to agreement %s.') %
                     (record.employee_id.name, record.agreement_id.name)
                 )
 
     def _validate_agreement_employee(self):
-        for record in self.filtered(lambda r: r.employee_id):
-            if record.agreement_id and record.agreement_id.driver_ids and record.employee_id not in record.agreement_id.driver_ids:
+        driver_sets = operation_common.agreement_driver_sets(self)
+        for record in self.filtered('employee_id'):
+            driver_ids = driver_sets.get(record.agreement_id.id)
+            if driver_ids and record.employee_id.id not in driver_ids:
                 raise ValidationError(
                     _('Employee %s is not assigned to agreement %s.') %
                     (record.employee_id.name, record.agreement_id.name)
@@ -186,16 +200,26 @@ class RmcInventoryHandover(models.Model):
     @api.constrains('agreement_id', 'item_id', 'state')
     def _check_unique_active_request(self):
         active_states = {'draft', 'issued', 'returned'}
+        pairs = {
+            (record.agreement_id.id, record.item_id.id)
+            for record in self
+            if record.state in active_states
+        }
+        if not pairs:
+            return
+        self.flush_model(['agreement_id', 'item_id', 'state'])
+        self.env.cr.execute("""
+            SELECT agreement_id, item_id
+              FROM rmc_inventory_handover
+             WHERE state IN %s
+               AND (agreement_id, item_id) IN %s
+          GROUP BY agreement_id, item_id
+            HAVING COUNT(*) > 1
+        """, (tuple(active_states), tuple(pairs)))
+        duplicates = set(self.env.cr.fetchall())
         for record in self:
-            if record.state in active_states:
-                duplicate = self.search([
-                    ('id', '!=', record.id),
-                    ('agreement_id', '=', record.agreement_id.id),
-                    ('item_id', '=', record.item_id.id),
-                    ('state', 'in', list(active_states))
-                ], limit=1)
-                if duplicate:
-                    raise ValidationError(
-                        _('Product %s already has an active inventory request for agreement %s.')
-                        % (record.item_id.display_name, record.agreement_id.name)
-                    )
+            if record.state in active_states and (record.agreement_id.id, record.item_id.id) in duplicates:
+                raise ValidationError(
+                    _('Product %s already has an active inventory request for agreement %s.')
+                    % (record.item_id.display_name, record.agreement_id.name)
+                )
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 import logging
+from collections import defaultdict
 from datetime import timedelta
 
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
+from odoo.osv import expression
+from odoo.tools import groupby
+
+from . import operation_common
 
 _logger = logging.getLogger(__name__)
 
@@ -14,7 +19,7 @@ class RmcMaintenanceCheck(models.Model):
     _order = 'date desc'
     _MAINTENANCE_SYNC_PARAM = 'rmc.maintenance.last_sync'
 
-    name = fields.Char(string='Reference', required=True, copy=False, readonly=True, default=lambda self: _('New'))
+    name = fields.Char(string='Reference', required=True, copy=False, readonly=True, index=True, default=lambda self: _('New'))
     agreement_id = fields.Many2one('rmc.contract.agreement', string='Agreement', required=True, ondelete='restrict', tracking=True)
     contractor_id = fields.Many2one(related='agreement_id.contractor_id', string='Contractor', store=True)
     date = fields.Date(string='Check Date', required=True, default=fields.Date.context_today, tracking=True)
@@ -42,10 +47,9 @@ class RmcMaintenanceCheck(models.Model):
             if vals.get('name', _('New')) == _('New'):
                 vals['name'] = self.env['ir.sequence'].next_by_code('rmc.maintenance.check') or _('New')
         records = super(RmcMaintenanceCheck, self).create(vals_list)
-        for record in records:
-            record._check_agreement_signature()
-            record._validate_agreement_employee()
-            record._default_employee_from_agreement()
+        records._check_agreement_signature()
+        records._validate_agreement_employee()
+        records._default_employee_from_agreement()
         return records
 
     def write(self, vals):
@@ -63,41 +67,53 @@ class RmcMaintenanceCheck(models.Model):
         return res
 
     def _check_agreement_signature(self):
-        for record in self:
-            if not record.agreement_id.is_signed():
-                record.state = 'pending_agreement'
-                record.message_post(body=_('Maintenance check pending agreement signature.'))
-                record.agreement_id.activity_schedule('mail.mail_activity_data_todo', summary=_('Sign agreement to validate maintenance'), note=_('Check %s waiting.') % record.name)
+        signed = {agreement.id: agreement.is_signed() for agreement in self.mapped('agreement_id')}
+        pending = self.filtered(lambda r: not signed.get(r.agreement_id.id, False))
+        if not pending:
+            return
+        pending.write({'state': 'pending_agreement'})
+        body = _('Maintenance check pending agreement signature.')
+        pending._message_log_batch({record.id: body for record in pending})
+        for agreement, records in groupby(pending, key=lambda r: r.agreement_id):
+            names = ', '.join(record.name for record in records)
+            agreement.activity_schedule('mail.mail_activity_data_todo', summary=_('Sign agreement to validate maintenance'), note=_('Check %s waiting.') % names)
 
     @api.constrains('checklist_ok', 'cost')
     def _check_values(self):
+        driver_sets = operation_common.agreement_driver_sets(self)
         for record in self:
             if record.checklist_ok < 0 or record.checklist_ok > 100:
                 raise ValidationError(_('Checklist completion must be between 0 and 100%.'))
             if record.cost < 0:
                 raise ValidationError(_('Cost cannot be negative.'))
-            if record.employee_id and record.agreement_id.driver_ids and record.employee_id not in record.agreement_id.driver_ids:
+            driver_ids = driver_sets.get(record.agreement_id.id)
+            if record.employee_id and driver_ids and record.employee_id.id not in driver_ids:
                 raise ValidationError(
                     _('Employee %s is not assigned to agreement %s.') %
                     (record.employee_id.name, record.agreement_id.name)
                 )
 
     def _validate_agreement_employee(self):
-        for record in self.filtered(lambda r: r.employee_id):
-            if record.agreement_id and record.agreement_id.driver_ids and record.employee_id not in record.agreement_id.driver_ids:
+        driver_sets = operation_common.agreement_driver_sets(self)
+        for record in self.filtered('employee_id'):
+            driver_ids = driver_sets.get(record.agreement_id.id)
+            if driver_ids and record.employee_id.id not in driver_ids:
                 raise ValidationError(
                     _('Employee %s is not assigned to agreement %s.') %
                     (record.employee_id.name, record.agreement_id.name)
                 )
 
     def _default_employee_from_agreement(self):
+        first_drivers = {agreement.id: agreement.driver_ids[:1].id for agreement in self.mapped('agreement_id')}
         for record in self:
-            if record.agreement_id and not record.employee_id and record.agreement_id.driver_ids:
-                record.employee_id = record.agreement_id.driver_ids[:1]
+            first_driver_id = first_drivers.get(record.agreement_id.id)
+            if not record.employee_id and first_driver_id:
+                record.employee_id = first_driver_id
 
     def action_validate(self):
+        signed = {agreement.id: agreement.is_signed() for agreement in self.mapped('agreement_id')}
         for record in self:
-            if not record.agreement_id.is_signed():
+            if not signed.get(record.agreement_id.id, False):
                 raise ValidationError(_('Cannot validate: Agreement not signed.'))
             record.state = 'validated'
             record.message_post(body=_('Maintenance check validated'))
@@ -109,59 +125,71 @@ class RmcMaintenanceCheck(models.Model):
     # Auto-sync helpers
     # ------------------------------------------------------------------
 
-    @api.model
-    def _build_employee_agreement_map(self, employee_ids):
-        employee_ids = [eid for eid in set(employee_ids) if eid]
-        mapping = {}
-        if not employee_ids:
-            return mapping
-        Agreement = self.env['rmc.contract.agreement'].sudo()
-        agreements = Agreement.search([
-            '|',
-            ('manpower_matrix_ids.employee_id', 'in', employee_ids),
-            ('driver_ids', 'in', employee_ids)
-        ])
-        for agreement in agreements:
-            employees = (agreement.driver_ids | agreement.manpower_matrix_ids.mapped('employee_id')).filtered(lambda e: e and e.id in employee_ids)
-            for employee in employees:
-                mapping.setdefault(employee.id, agreement)
-        return mapping
-
     @api.model
     def _safe_employee_for_agreement(self, employee, agreement):
         if not employee or not agreement:
             return False
-        if agreement.driver_ids and employee not in agreement.driver_ids:
+        if agreement.driver_ids and employee.id not in agreement.driver_ids._ids:
             return False
         return employee
 
-    def _copy_attachments_from_source(self, source_model, source_id, target_record):
+    @api.model
+    def _copy_attachments_batch(self, links, fresh_target_ids=()):
+        """Copy attachments for ``(source_model, source_id, target_record)`` links.
+
+        Source and destination attachments are fetched with one search each and
+        the copies are inserted with a single ``create``. ``fresh_target_ids``
+        lists targets created in this run, which cannot hold attachments yet.
+        """
+        if not links:
+            return
         Attachment = self.env['ir.attachment'].sudo()
-        source_attachments = Attachment.search([
-            ('res_model', '=', source_model),
-            ('res_id', '=', source_id)
-        ])
+        source_ids = defaultdict(set)
+        for source_model, source_id, _target in links:
+            source_ids[source_model].add(source_id)
+        source_attachments = Attachment.search(expression.OR([
+            [('res_model', '=', source_model), ('res_id', 'in', list(ids))]
+            for source_model, ids in source_ids.items()
+        ]))
         if not source_attachments:
             return
-        dest_attachments = Attachment.search([
-            ('res_model', '=', target_record._name),
-            ('res_id', '=', target_record.id)
-        ])
-        existing_checksums = set(filter(None, dest_attachments.mapped('checksum')))
+        sources_by_key = defaultdict(list)
         for attachment in source_attachments:
-            checksum = attachment.checksum
-            if checksum and checksum in existing_checksums:
-                continue
-            Attachment.create({
-                'name': attachment.name,
-                'datas': attachment.datas,
-                'mimetype': attachment.mimetype,
-                'res_model': target_record._name,
-                'res_id': target_record.id,
-                'type': attachment.type,
-            })
-            if checksum:
-                existing_checksums.add(checksum)
+            sources_by_key[(attachment.res_model, attachment.res_id)].append(attachment)
+        # Most sources carry no attachment: drop their links before touching
+        # the destination side.
+        links = [link for link in links if (link[0], link[1]) in sources_by_key]
+        fresh_target_ids = set(fresh_target_ids)
+        target_ids = list({target.id for _model, _id, target in links} - fresh_target_ids)
+        existing_checksums = defaultdict(set)
+        if target_ids:
+            for dest in Attachment.search([('res_model', '=', self._name), ('res_id', 'in', target_ids)]):
+                if dest.checksum:
+                    existing_checksums[dest.res_id].add(dest.checksum)
+        # Decide what to copy from checksums alone; the binary payload is only
+        # read for the attachments that survive deduplication.
+        to_copy = []
+        for source_model, source_id, target_record in links:
+            checksums = existing_checksums[target_record.id]
+            for attachment in sources_by_key.get((source_model, source_id), []):
+                checksum = attachment.checksum
+                if checksum and checksum in checksums:
+                    continue
+                to_copy.append((attachment.id, target_record))
+                if checksum:
+                    checksums.add(checksum)
+        if not to_copy:
+            return
+        copy_ids = list({attachment_id for attachment_id, _target in to_copy})
+        rows = {row['id']: row for row in Attachment.browse(copy_ids).read(['name', 'datas', 'mimetype', 'type'])}
+        Attachment.create([{
+            'name': rows[attachment_id]['name'],
+            'datas': rows[attachment_id]['datas'],
+            'mimetype': rows[attachment_id]['mimetype'],
+            'res_model': target_record._name,
+            'res_id': target_record.id,
+            'type': rows[attachment_id]['type'],
+        } for attachment_id, target_record in to_copy])
 
     @api.model
     def _prepare_request_vals(self, request, agreement, employee_map):
@@ -202,23 +230,6 @@ class RmcMaintenanceCheck(models.Model):
         }
         return vals
 
-    def _upsert_request(self, request, employee_map):
-        agreement = request.agreement_id or employee_map.get(request.employee_id.id if request.employee_id else False)
-        vals = self._prepare_request_vals(request, agreement, employee_map)
-        if not vals:
-            return False, False
-        sync_name = f"SYNC-MR-{request.id}"
-        record = self.search([('name', '=', sync_name)], limit=1)
-        created = False
-        if record:
-            record.write(vals)
-        else:
-            vals['name'] = sync_name
-            record = self.create(vals)
-            created = True
-        self._copy_attachments_from_source('maintenance.request', request.id, record)
-        return record, created
-
     @api.model
     def _prepare_breakdown_vals(self, breakdown):
         checklist = 100.0 if breakdown.state == 'closed' else 60.0
@@ -236,24 +247,48 @@ class RmcMaintenanceCheck(models.Model):
             'notes': _('Auto-synced from breakdown %s') % (breakdown.name or breakdown.id),
         }
 
-    def _upsert_breakdown(self, breakdown):
-        vals = self._prepare_breakdown_vals(breakdown)
-        sync_name = f"SYNC-BD-{breakdown.id}"
-        record = self.search([('name', '=', sync_name)], limit=1)
-        created = False
-        if record:
-            record.write(vals)
-        else:
-            vals['name'] = sync_name
-            record = self.create(vals)
-            created = True
-        self._copy_attachments_from_source('rmc.breakdown.event', breakdown.id, record)
-        return record, created
+    def _sync_vals_changed(self, vals):
+        self.ensure_one()
+        for fname, value in vals.items():
+            current = self[fname]
+            if self._fields[fname].type == 'many2one':
+                current = current.id
+            if (current or False) != (value or False):
+                return True
+        return False
 
     @api.model
-    def _timestamp_from_record(self, record):
-        ts = record.write_date or record.create_date
-        return fields.Datetime.from_string(ts) if ts else None
+    def _sync_entries(self, entries, existing_map=None):
+        """Upsert ``(sync_name, source_model, source_id, vals)`` entries in bulk.
+
+        New checks are created with a single ``create`` call; existing ones are
+        only written when their synced values actually changed.
+        Returns the ``(created, updated)`` counts.
+        """
+        to_create = []
+        create_sources = []
+        synced = []
+        if existing_map is None:
+            existing_map = {}
+            for record in self.search([('name', 'in', [entry[0] for entry in entries])]):
+                existing_map.setdefault(record.name, record)
+        for sync_name, source_model, source_id, vals in entries:
+            record = operation_common.match_existing(self, sync_name, existing_map)
+            if record:
+                if record._sync_vals_changed(vals):
+                    record.write(vals)
+                synced.append((source_model, source_id, record))
+            else:
+                to_create.append(dict(vals, name=sync_name))
+                create_sources.append((source_model, source_id))
+        updated = len(synced)
+        records = self.create(to_create) if to_create else self.browse()
+        synced.extend(
+            (source_model, source_id, record)
+            for (source_model, source_id), record in zip(create_sources, records)
+        )
+        self._copy_attachments_batch(synced, fresh_target_ids=records.ids)
+        return len(to_create), updated
 
     @api.model
     def cron_sync_from_maintenance(self):
@@ -277,31 +312,24 @@ class RmcMaintenanceCheck(models.Model):
         breakdowns = Breakdown.search(breakdown_domain, order='write_date asc, id asc')
         employees = requests.mapped('employee_id').ids
         equipment_employees = requests.mapped('equipment_id.employee_id').ids
-        employee_map = self._build_employee_agreement_map(employees + equipment_employees)
-        latest = last_sync
-        created = updated = 0
+        employee_map = operation_common.build_employee_agreement_map(self.env, employees + equipment_employees)
+        entries = []
+        synced_requests = []
         for request in requests:
-            record, is_created = self._upsert_request(request, employee_map)
-            if not record:
+            agreement = request.agreement_id or employee_map.get(request.employee_id.id if request.employee_id else False)
+            vals = self._prepare_request_vals(request, agreement, employee_map)
+            if not vals:
                 continue
-            if is_created:
-                created += 1
-            else:
-                updated += 1
-            timestamp = self._timestamp_from_record(request)
-            if timestamp:
-                latest = timestamp if not latest else max(latest, timestamp)
+            entries.append((f"SYNC-MR-{request.id}", 'maintenance.request', request.id, vals))
+            synced_requests.append(request)
         for breakdown in breakdowns:
-            record, is_created = self._upsert_breakdown(breakdown)
-            if not record:
-                continue
-            if is_created:
-                created += 1
-            else:
-                updated += 1
-            timestamp = self._timestamp_from_record(breakdown)
-            if timestamp:
-                latest = timestamp if not latest else max(latest, timestamp)
+            vals = self._prepare_breakdown_vals(breakdown)
+            entries.append((f"SYNC-BD-{breakdown.id}", 'rmc.breakdown.event', breakdown.id, vals))
+        created, updated = self._sync_entries(entries)
+        # write_date/create_date are already datetime objects.
+        timestamps = [record.write_date or record.create_date for record in synced_requests]
+        timestamps += [record.write_date or record.create_date for record in breakdowns]
+        latest = max(filter(None, timestamps + [last_sync]), default=None)
         if latest:
             ICP.set_param(self._MAINTENANCE_SYNC_PARAM, fields.Datetime.to_string(latest))
         if created or updated:
@@ -5,6 +5,7 @@ Manpower Matrix - Designation-wise wage structure
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools import groupby
 
 
 class RmcManpowerMatrix(models.Model):
@@ -33,7 +34,8 @@ class RmcManpowerMatrix(models.Model):
         'fleet.vehicle',
         string='Assigned Vehicle/Equipment',
         help='Vehicle or equipment linked to this employee/designation',
-        ondelete='restrict'
+        ondelete='restrict',
+        index=True
     )
     headcount = fields.Integer(
         string='Headcount',
@@ -110,24 +112,25 @@ class RmcManpowerMatrix(models.Model):
     @api.depends('headcount', 'base_rate')
     def _compute_total(self):
         """Calculate total = headcount × base_rate"""
-        for record in self:
-            record.total_amount = record.headcount * record.base_rate
+        totals = [headcount * rate for headcount, rate in zip(self.mapped('headcount'), self.mapped('base_rate'))]
+        for record, total in zip(self, totals):
+            record.total_amount = total
 
     @api.depends('employee_id', 'employee_id.job_id', 'designation')
     def _compute_job_position(self):
+        # Warm employee -> job in two batched reads before the loop.
+        self.mapped('employee_id.job_id.name')
         for record in self:
-            job_name = record.employee_id.job_id.name if record.employee_id and record.employee_id.job_id else False
+            job_name = record.employee_id.job_id.name or False
             record.job_position_name = job_name or record.designation or False
             # keep legacy designation in sync when employee changes and designation empty
-            if record.employee_id and not record.designation and job_name:
+            if job_name and not record.designation:
                 record.designation = job_name
 
     @api.onchange('employee_id')
     def _onchange_employee_id(self):
-        for record in self:
-            if record.employee_id:
-                record.headcount = 1
-        return {}
+        if self.employee_id:
+            self.headcount = 1
 
     @api.constrains('headcount', 'base_rate')
     def _check_positive(self):
@@ -142,32 +145,48 @@ class RmcManpowerMatrix(models.Model):
                     _('Headcount must be 1 when an employee is assigned.')
                 )
 
+    def _find_duplicate_assignment(self, fname):
+        """Return the first (agreement, record) pair assigned twice on ``fname``."""
+        records = self.filtered(fname)
+        if not records:
+            return False
+        groups = self._read_group(
+            [('agreement_id', 'in', records.agreement_id.ids), (fname, 'in', records[fname].ids)],
+            groupby=['agreement_id', fname],
+            aggregates=['__count'],
+            having=[('__count', '>', 1)],
+        )
+        # The domain also matches cross pairs, so keep only those present in self.
+        pairs = {(record.agreement_id, record[fname]) for record in records}
+        for agreement, value, _count in groups:
+            if (agreement, value) in pairs:
+                return agreement, value
+        return False
+
     @api.constrains('employee_id', 'agreement_id')
     def _check_unique_employee(self):
-        for record in self.filtered('employee_id'):
-            duplicates = record.agreement_id.manpower_matrix_ids.filtered(
-                lambda r: r.id != record.id and r.employee_id == record.employee_id
+        duplicate = self._find_duplicate_assignment('employee_id')
+        if duplicate:
+            raise ValidationError(
+                _('Employee %s is already assigned on manpower matrix.')
+                % duplicate[1].name
             )
-            if duplicates:
-                raise ValidationError(
-                    _('Employee %s is already assigned on manpower matrix.')
-                    % record.employee_id.name
-                )
 
     @api.constrains('vehicle_id', 'agreement_id')
     def _check_vehicle_consistency(self):
-        for record in self.filtered('vehicle_id'):
-            duplicates = record.agreement_id.manpower_matrix_ids.filtered(
-                lambda r: r.id != record.id and r.vehicle_id == record.vehicle_id
+        duplicate = self._find_duplicate_assignment('vehicle_id')
+        if duplicate:
+            raise ValidationError(
+                _('Vehicle %s is already assigned on another manpower line.') %
+                duplicate[1].display_name
             )
-            if duplicates:
-                raise ValidationError(
-                    _('Vehicle %s is already assigned on another manpower line.') %
-                    record.vehicle_id.display_name
-                )
 
-    def _update_parent_agreements(self):
-        agreements = self.mapped('agreement_id')
+    def _update_parent_agreements(self, agreements=None):
+        # The agreement refreshes its totals once itself when the lines are
+        # written through its one2many.
+        if self.env.context.get('rmc_defer_matrix_totals'):
+            return
+        agreements = self.mapped('agreement_id') if agreements is None else agreements
         if agreements:
             agreements._update_manpower_totals_from_matrix()
 
@@ -185,8 +204,7 @@ class RmcManpowerMatrix(models.Model):
     def unlink(self):
         agreements = self.mapped('agreement_id')
         res = super().unlink()
-        if agreements:
-            agreements._update_manpower_totals_from_matrix()
+        self._update_parent_agreements(agreements.exists())
         return res
 
     @api.depends(
@@ -198,30 +216,34 @@ class RmcManpowerMatrix(models.Model):
     )
     def _compute_attendance_proration(self):
         """Compute attendance ratio and related monetary adjustments."""
-        for record in self:
-            ratio = 0.0
-            prorated = 0.0
-            deduction = 0.0
-            if record.remark == 'part_a':
-                total_days = record.attendance_total_days or 0.0
-                present_days = record.attendance_present_days or 0.0
-                if total_days > 0:
-                    ratio = present_days / total_days if total_days else 0.0
-                else:
-                    # When total days not provided, keep full Part-A amount
-                    ratio = 1.0
-                ratio = max(0.0, min(ratio, 1.0))
-                base_amount = record.total_amount or 0.0
-                prorated = base_amount * ratio
-                currency = record.currency_id
-                if currency:
-                    prorated = currency.round(prorated)
-                    deduction = currency.round(base_amount - prorated)
-                else:
-                    deduction = base_amount - prorated
-            record.attendance_ratio = ratio
-            record.attendance_prorated_amount = prorated
-            record.attendance_deduction_amount = deduction
+        part_a = self.filtered(lambda r: r.remark == 'part_a')
+        for record in self - part_a:
+            record.attendance_ratio = 0.0
+            record.attendance_prorated_amount = 0.0
+            record.attendance_deduction_amount = 0.0
+        # Work column-wise per currency so rounding is resolved once per group.
+        currencies = {currency.id: currency for currency in part_a.mapped('currency_id')}
+        for currency_id, rows in groupby(part_a, key=lambda r: r.currency_id.id):
+            currency = currencies.get(currency_id)
+            bases = [record.total_amount or 0.0 for record in rows]
+            ratios = [
+                max(0.0, min((record.attendance_present_days or 0.0) / record.attendance_total_days, 1.0))
+                if (record.attendance_total_days or 0.0) > 0
+                # When total days not provided, keep full Part-A amount
+                else 1.0
+                for record in rows
+            ]
+            prorated = [base * ratio for base, ratio in zip(bases, ratios)]
+            if currency:
+                currency_round = currency.round
+                prorated = [currency_round(amount) for amount in prorated]
+                deductions = [currency_round(base - amount) for base, amount in zip(bases, prorated)]
+            else:
+                deductions = [base - amount for base, amount in zip(bases, prorated)]
+            for record, ratio, amount, deduction in zip(rows, ratios, prorated, deductions):
+                record.attendance_ratio = ratio
+                record.attendance_prorated_amount = amount
+                record.attendance_deduction_amount = deduction
 
     _sql_constraints = [
         (
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Shared helpers for agreement-bound operation records."""
+
+from collections import defaultdict
+
+
+def agreement_driver_sets(records):
+    """Return {agreement_id: frozenset(driver ids)} for the agreements of ``records``."""
+    agreements = records.mapped('agreement_id')
+    agreements.fetch(['driver_ids'])
+    return {agreement.id: frozenset(agreement.driver_ids._ids) for agreement in agreements}
+
+
+def match_existing(model, sync_name, existing_map=None):
+    """Return the ``model`` record named ``sync_name``, from ``existing_map`` when given."""
+    if existing_map is None:
+        return model.search([('name', '=', sync_name)], limit=1)
+    return existing_map.get(sync_name, model.browse())
+
+
+def build_employee_agreement_map(env, employee_ids):
+    """Return a {employee_id: agreement} mapping."""
+    employee_ids = [eid for eid in set(employee_ids) if eid]
+    mapping = {}
+    if not employee_ids:
+        return mapping
+    emp_set = set(employee_ids)
+    Agreement = env['rmc.contract.agreement'].sudo()
+    rows = Agreement.search_read([
+        '|',
+        ('manpower_matrix_ids.employee_id', 'in', employee_ids),
+        ('driver_ids', 'in', employee_ids)
+    ], ['driver_ids'])
+    if not rows:
+        return mapping
+    env['rmc.manpower.matrix'].flush_model(['agreement_id', 'employee_id'])
+    env.cr.execute("""
+        SELECT agreement_id, employee_id
+          FROM rmc_manpower_matrix
+         WHERE agreement_id = ANY(%s) AND employee_id = ANY(%s)
+    """, [[row['id'] for row in rows], employee_ids])
+    matrix_employees = defaultdict(set)
+    for agreement_id, employee_id in env.cr.fetchall():
+        matrix_employees[agreement_id].add(employee_id)
+    # Rows come back in agreement order, so the first match wins as before.
+    for row in rows:
+        agreement = Agreement.browse(row['id'])
+        for employee_id in (set(row['driver_ids']) & emp_set) | matrix_employees[row['id']]:
+            mapping.setdefault(employee_id, agreement)
+    return mapping
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Shared sequence helpers for batch record creation."""
+
+from odoo import _
+
+
+def next_sequence_names(env, code, count):
+    """Draw ``count`` references from the ``code`` sequence.
+
+    The sequence is looked up once, the way ``ir.sequence.next_by_code`` picks it,
+    and each reference is drawn for today, as ``next_by_code`` does.
+    """
+    if not count:
+        return []
+    sequence = env['ir.sequence'].sudo().search([
+        ('code', '=', code),
+        ('company_id', 'in', [env.company.id, False]),
+    ], order='company_id', limit=1)
+    if not sequence:
+        return [_('New')] * count
+    return [sequence._next() for _i in range(count)]
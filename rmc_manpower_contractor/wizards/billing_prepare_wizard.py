@@ -9,6 +9,96 @@ import logging
 
 _logger = logging.getLogger(__name__)
 
+
+def _mgq_achievement_pct(mgq_achieved, mgq_target):
+    if mgq_target > 0:
+        return (mgq_achieved / mgq_target) * 100
+    return 0.0
+
+
+def _part_b_base(agreement):
+    part_b_lines = agreement.manpower_matrix_ids.filtered(lambda x: x.remark == 'part_b')
+    part_b_base = sum(part_b_lines.mapped('total_amount'))
+    if not part_b_base:
+        part_b_base = agreement.part_b_variable or agreement.manpower_part_b_amount or 0.0
+    return part_b_base
+
+
+def _part_b_amount(part_b_base, mgq_achievement_pct):
+    # Apply MGQ achievement factor (if MGQ < 100%, reduce Part-B proportionally)
+    if mgq_achievement_pct >= 100:
+        return part_b_base
+    return part_b_base * (mgq_achievement_pct / 100.0)
+
+
+def _prorate_attendance(agreement, period_start, period_end):
+    """Populate attendance days on the agreement's Part-A lines for the given period."""
+    if not agreement or not period_start or not period_end:
+        return
+    part_a_lines = agreement.manpower_matrix_ids.filtered(lambda x: x.remark == 'part_a')
+    if not part_a_lines:
+        return
+    start_date = fields.Date.to_date(period_start)
+    end_date = fields.Date.to_date(period_end)
+    if not start_date or not end_date or end_date < start_date:
+        return
+    scheduled_days = (end_date - start_date).days + 1
+    Attendance = agreement.env['rmc.attendance.compliance']
+    attendance_records = Attendance.search([
+        ('agreement_id', '=', agreement.id),
+        ('date', '>=', start_date),
+        ('date', '<=', end_date),
+    ])
+    employee_present_days = defaultdict(float)
+    total_man_days = 0.0
+    for record in attendance_records:
+        if not record.date:
+            continue
+        total_man_days += record.headcount_present or 0.0
+        for employee in record.employee_ids:
+            employee_present_days[employee.id] += 1.0
+    total_part_a_headcount = sum(part_a_lines.mapped('headcount')) or 0.0
+    expected_man_days = total_part_a_headcount * scheduled_days
+    if attendance_records and expected_man_days:
+        fallback_ratio = total_man_days / expected_man_days
+    else:
+        fallback_ratio = 1.0
+    fallback_ratio = max(0.0, min(fallback_ratio, 1.0))
+
+    for line in part_a_lines:
+        total_days = float(scheduled_days) if scheduled_days > 0 else 0.0
+        if not total_days:
+            present_days = 0.0
+        elif line.employee_id:
+            present_days = min(employee_present_days.get(line.employee_id.id, 0.0), total_days)
+        else:
+            present_days = total_days * fallback_ratio
+        vals = {
+            'attendance_total_days': total_days,
+            'attendance_present_days': present_days,
+        }
+        # Avoid unnecessary writes when values already in sync
+        if (
+            line.attendance_total_days != vals['attendance_total_days'] or
+            line.attendance_present_days != vals['attendance_present_days']
+        ):
+            line.with_context(rmc_attendance_proration=True).write(vals)
+
+
+def _compute_mgq_snapshot(agreement, period_start, period_end, prime_output_qty=0.0, optimized_standby_qty=0.0, prorate=True):
+    """Return ``(actual_qty, target, part_b_amount)`` the billing wizard would compute for the period.
+
+    Runs the same attendance proration as the wizard without creating a wizard record,
+    unless ``prorate`` is False. The proration never changes the returned figures.
+    """
+    if prorate:
+        _prorate_attendance(agreement, period_start, period_end)
+    actual_qty = (prime_output_qty or 0.0) + (optimized_standby_qty or 0.0)
+    target = agreement.mgq_target or 0.0
+    achievement_pct = _mgq_achievement_pct(actual_qty, target)
+    return actual_qty, target, _part_b_amount(_part_b_base(agreement), achievement_pct)
+
+
 class RmcBillingPrepareWizard(models.Model):
     _name = 'rmc.billing.prepare.wizard'
     _description = 'RMC Monthly Billing Preparation Wizard'
@@ -99,10 +189,7 @@ class RmcBillingPrepareWizard(models.Model):
     @api.depends('mgq_achieved', 'mgq_target')
     def _compute_mgq(self):
         for wizard in self:
-            if wizard.mgq_target > 0:
-                wizard.mgq_achievement_pct = (wizard.mgq_achieved / wizard.mgq_target) * 100
-            else:
-                wizard.mgq_achievement_pct = 0.0
+            wizard.mgq_achievement_pct = _mgq_achievement_pct(wizard.mgq_achieved, wizard.mgq_target)
 
     @api.onchange('agreement_id')
     def _onchange_agreement_id(self):
@@ -159,56 +246,7 @@ class RmcBillingPrepareWizard(models.Model):
     def _apply_attendance_proration(self):
         """Populate attendance days on manpower lines based on compliance records."""
         self.ensure_one()
-        if not self.agreement_id or not self.period_start or not self.period_end:
-            return
-        part_a_lines = self.agreement_id.manpower_matrix_ids.filtered(lambda x: x.remark == 'part_a')
-        if not part_a_lines:
-            return
-        start_date = fields.Date.to_date(self.period_start)
-        end_date = fields.Date.to_date(self.period_end)
-        if not start_date or not end_date or end_date < start_date:
-            return
-        scheduled_days = (end_date - start_date).days + 1
-        Attendance = self.env['rmc.attendance.compliance']
-        attendance_records = Attendance.search([
-            ('agreement_id', '=', self.agreement_id.id),
-            ('date', '>=', start_date),
-            ('date', '<=', end_date),
-        ])
-        employee_present_days = defaultdict(float)
-        total_man_days = 0.0
-        for record in attendance_records:
-            if not record.date:
-                continue
-            total_man_days += record.headcount_present or 0.0
-            for employee in record.employee_ids:
-                employee_present_days[employee.id] += 1.0
-        total_part_a_headcount = sum(part_a_lines.mapped('headcount')) or 0.0
-        expected_man_days = total_part_a_headcount * scheduled_days
-        if attendance_records and expected_man_days:
-            fallback_ratio = total_man_days / expected_man_days
-        else:
-            fallback_ratio = 1.0
-        fallback_ratio = max(0.0, min(fallback_ratio, 1.0))
-
-        for line in part_a_lines:
-            total_days = float(scheduled_days) if scheduled_days > 0 else 0.0
-            if not total_days:
-                present_days = 0.0
-            elif line.employee_id:
-                present_days = min(employee_present_days.get(line.employee_id.id, 0.0), total_days)
-            else:
-                present_days = total_days * fallback_ratio
-            vals = {
-                'attendance_total_days': total_days,
-                'attendance_present_days': present_days,
-            }
-            # Avoid unnecessary writes when values already in sync
-            if (
-                line.attendance_total_days != vals['attendance_total_days'] or
-                line.attendance_present_days != vals['attendance_present_days']
-            ):
-                line.with_context(rmc_attendance_proration=True).write(vals)
+        _prorate_attendance(self.agreement_id, self.period_start, self.period_end)
 
     @api.depends(
         'agreement_id.manpower_matrix_ids.remark',
@@ -236,16 +274,7 @@ class RmcBillingPrepareWizard(models.Model):
             wizard.part_a_amount = prorated_part_a
 
             # Part-B: Variable component based on MGQ achievement
-            part_b_lines = wizard.agreement_id.manpower_matrix_ids.filtered(lambda x: x.remark == 'part_b')
-            part_b_base = sum(part_b_lines.mapped('total_amount'))
-            if not part_b_base:
-                part_b_base = wizard.agreement_id.part_b_variable or wizard.agreement_id.manpower_part_b_amount or 0.0
-            
-            # Apply MGQ achievement factor (if MGQ < 100%, reduce Part-B proportionally)
-            if wizard.mgq_achievement_pct >= 100:
-                wizard.part_b_amount = part_b_base
-            else:
-                wizard.part_b_amount = part_b_base * (wizard.mgq_achievement_pct / 100.0)
+            wizard.part_b_amount = _part_b_amount(_part_b_base(wizard.agreement_id), wizard.mgq_achievement_pct)
             
             # Breakdown deductions (Clause 9)
             breakdown_events = wizard.env['rmc.breakdown.event'].search([
@@ -392,7 +421,8 @@ class RmcBillingPrepareWizard(models.Model):
         _, total_issued, total_consumption = self._prepare_diesel_rows(diesel_records) if diesel_records else ([], 0.0, 0.0)
         log_vals = {
             'agreement_id': self.agreement_id.id,
-            'wizard_id': self.id,
+            # In-memory wizards (see billing log snapshots) have no row to link to.
+            'wizard_id': self._origin.id,
             'bill_id': bill.id if bill else False,
             'period_start': self.period_start,
             'period_end': self.period_end,
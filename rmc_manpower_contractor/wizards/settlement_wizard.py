@@ -2,16 +2,27 @@
 """Settlement wizard for agreement closure"""
 
 import base64
+from collections import defaultdict
 from datetime import datetime, time
 
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
+from odoo.tools import groupby
 from odoo.tools.float_utils import float_is_zero, float_compare
 
+from .billing_prepare_wizard import _compute_mgq_snapshot
+
+_PROPOSED_ACTIONS = [
+    ('final_bill', 'Create Final Bill'),
+    ('credit_note', 'Create Credit Note'),
+    ('zero_balance', 'Zero Balance'),
+]
+
 
 class RmcAgreementSettlementWizard(models.TransientModel):
     _name = 'rmc.agreement.settlement.wizard'
     _description = 'Agreement Settlement Wizard'
+    _PROPOSED_ACTION_LABELS = dict(_PROPOSED_ACTIONS)
 
     agreement_id = fields.Many2one(
         'rmc.contract.agreement',
@@ -45,19 +56,13 @@ class RmcAgreementSettlementWizard(models.TransientModel):
         currency_field='currency_id',
         readonly=True,
         compute='_compute_open_bills_total',
-        store=True,
     )
     final_payable_amount = fields.Monetary(
         string='Final Payable',
         currency_field='currency_id',
         compute='_compute_final_payable',
-        store=True
     )
-    proposed_action = fields.Selection([
-        ('final_bill', 'Create Final Bill'),
-        ('credit_note', 'Create Credit Note'),
-        ('zero_balance', 'Zero Balance'),
-    ], string='Proposed Action', default='zero_balance', required=True)
+    proposed_action = fields.Selection(_PROPOSED_ACTIONS, string='Proposed Action', default='zero_balance', required=True)
     notes = fields.Text(string='Notes')
     breakdown_event_ids = fields.Many2many(
         'rmc.breakdown.event',
@@ -111,93 +116,131 @@ class RmcAgreementSettlementWizard(models.TransientModel):
         return records
 
     def _compute_action_label(self):
-        selection = dict(self._fields['proposed_action'].selection)
+        labels = self._PROPOSED_ACTION_LABELS
         for wizard in self:
-            wizard.proposed_action_label = selection.get(wizard.proposed_action)
+            wizard.proposed_action_label = labels.get(wizard.proposed_action)
 
     def _prefill_financials(self):
-        for wizard in self:
-            if not wizard.agreement_id:
-                continue
-            wizard._load_mgq_snapshot()
-            wizard._load_breakdown_records()
-            wizard._load_inventory_records()
-            wizard._load_open_bills()
-            wizard._evaluate_hold_state()
+        self.fetch(['agreement_id', 'contractor_id', 'currency_id', 'period_start', 'period_end'])
+        wizards = self.filtered('agreement_id')
+        if not wizards:
+            return
+        agreements = wizards.agreement_id
+        # Fields read per wizard by the MGQ snapshot and the settlement blockers.
+        agreements.fetch(['currency_id', 'mgq_target', 'part_b_variable', 'sign_request_id'])
+        agreement_ids = agreements.ids
+        windows = {wizard.id: wizard._breakdown_window() for wizard in wizards}
+        # Only the columns needed to split events per wizard and total them.
+        events = self.env['rmc.breakdown.event'].search_fetch([
+            ('agreement_id', 'in', agreement_ids),
+            ('start_time', '>=', min(start for start, _end in windows.values())),
+            ('start_time', '<=', max(end for _start, end in windows.values())),
+            ('responsibility', '=', 'contractor'),
+            ('settlement_included', '=', False),
+        ], ['agreement_id', 'start_time', 'deduction_amount'], order='id')
+        inventory_domain = [
+            ('agreement_id', 'in', agreement_ids),
+            ('state', '!=', 'reconciled'),
+            ('settlement_included', '=', False),
+        ]
+        Inventory = self.env['rmc.inventory.handover']
+        inventory = Inventory.search(inventory_domain, order='id')
+        inventory_totals = defaultdict(lambda: [0.0, 0.0])
+        for agreement, is_final, variance_sum, damage_sum in Inventory._read_group(
+            inventory_domain,
+            groupby=['agreement_id', 'is_final'],
+            aggregates=['variance_value:sum', 'damage_cost:sum'],
+        ):
+            totals = inventory_totals[agreement.id]
+            totals[0] += variance_sum or 0.0
+            if is_final:
+                totals[1] += damage_sum or 0.0
+        # Bills are grouped by agreement and linked by id; their residuals feed open_bills_total.
+        bills = self.env['account.move'].search_fetch([
+            ('agreement_id', 'in', agreement_ids),
+            ('move_type', 'in', ('in_invoice', 'in_refund')),
+            ('payment_state', '!=', 'paid'),
+            ('state', 'in', ('posted', 'draft')),
+        ], ['agreement_id', 'amount_residual'], order='id')
+        events_by_agreement = self._group_by_agreement(events)
+        inventory_by_agreement = self._group_by_agreement(inventory)
+        bills_by_agreement = self._group_by_agreement(bills)
+        Breakdown = self.env['rmc.breakdown.event']
+        AccountMove = self.env['account.move']
+        for wizard in wizards:
+            agreement_id = wizard.agreement_id.id
+            start_dt, end_dt = windows[wizard.id]
+            wizard_events = events_by_agreement.get(agreement_id, Breakdown).filtered(
+                lambda event: start_dt <= event.start_time <= end_dt
+            )
+            vals = wizard._mgq_snapshot_vals()
+            vals.update(wizard._breakdown_vals(wizard_events))
+            variance_total, damage_total = inventory_totals[agreement_id]
+            wizard_inventory = inventory_by_agreement.get(agreement_id, Inventory)
+            hold, reason = wizard._get_hold_state(inventory_records=wizard_inventory)
+            vals.update({
+                'hold_detected': hold,
+                'hold_reason': reason,
+                'inventory_handover_ids': [(6, 0, wizard_inventory.ids)],
+                'damage_cost_total': damage_total,
+                'inventory_variance_total': variance_total + damage_total,
+            })
+            vals['open_bill_ids'] = [(6, 0, bills_by_agreement.get(agreement_id, AccountMove).ids)]
+            wizard.write(vals)
+
+    @staticmethod
+    def _group_by_agreement(records):
+        return {
+            agreement_id: records.browse([record.id for record in group])
+            for agreement_id, group in groupby(records, key=lambda record: record.agreement_id.id)
+        }
 
-    def _load_mgq_snapshot(self):
+    def _mgq_snapshot_vals(self):
         self.ensure_one()
-        BillingWizard = self.env['rmc.billing.prepare.wizard']
-        billing = BillingWizard.create({
-            'agreement_id': self.agreement_id.id,
-            'period_start': self.period_start,
-            'period_end': self.period_end,
-        })
-        billing._sync_mgq_with_prime_output()
-        billing._apply_attendance_proration()
-        billing._compute_billing_amounts()
-        actual_qty = billing.mgq_achieved or 0.0
-        target = billing.mgq_target or 0.0
-        variable_amount = billing.part_b_amount or 0.0
+        # Closures often have no attendance left in the window; skip the proration then.
+        has_attendance = bool(self.period_start and self.period_end) and bool(
+            self.env['rmc.attendance.compliance'].search_count([
+                ('agreement_id', '=', self.agreement_id.id),
+                ('date', '>=', self.period_start),
+                ('date', '<=', self.period_end),
+            ], limit=1)
+        )
+        actual_qty, target, variable_amount = _compute_mgq_snapshot(
+            self.agreement_id, self.period_start, self.period_end, prorate=has_attendance,
+        )
         mgq_ok = bool(target and actual_qty >= target)
-        vals = {
+        return {
             'mgq_actual_qty': actual_qty,
             'mgq_achieved': mgq_ok,
             'variable_pay_amount': variable_amount,
         }
-        billing.unlink()
-        self.write(vals)
 
-    def _load_breakdown_records(self):
+    def _breakdown_window(self):
         self.ensure_one()
-        Breakdown = self.env['rmc.breakdown.event']
-        start_date = fields.Date.from_string(self.period_start) if self.period_start else fields.Date.context_today(self)
-        end_date = fields.Date.from_string(self.period_end) if self.period_end else fields.Date.context_today(self)
-        start_dt = datetime.combine(start_date, time.min)
-        end_dt = datetime.combine(end_date, time.max)
-        events = Breakdown.search([
-            ('agreement_id', '=', self.agreement_id.id),
-            ('start_time', '>=', fields.Datetime.to_string(start_dt)),
-            ('start_time', '<=', fields.Datetime.to_string(end_dt)),
-            ('responsibility', '=', 'contractor'),
-            ('settlement_included', '=', False),
-        ])
-        self.write({
+        today = None
+        if not self.period_start or not self.period_end:
+            today = fields.Date.context_today(self)
+        return (
+            datetime.combine(self.period_start or today, time.min),
+            datetime.combine(self.period_end or today, time.max),
+        )
+
+    def _breakdown_vals(self, events):
+        return {
             'breakdown_event_ids': [(6, 0, events.ids)],
             'breakdown_deduction_total': sum(events.mapped('deduction_amount')),
-        })
-
-    def _load_inventory_records(self):
-        self.ensure_one()
-        Inventory = self.env['rmc.inventory.handover']
-        records = Inventory.search([
-            ('agreement_id', '=', self.agreement_id.id),
-            ('state', '!=', 'reconciled'),
-            ('settlement_included', '=', False),
-        ])
-        damage_total = sum(records.filtered('is_final').mapped('damage_cost'))
-        variance_total = sum(records.mapped('variance_value'))
-        self.write({
-            'inventory_handover_ids': [(6, 0, records.ids)],
-            'damage_cost_total': damage_total,
-            'inventory_variance_total': variance_total + damage_total,
-        })
-
-    def _load_open_bills(self):
-        self.ensure_one()
-        AccountMove = self.env['account.move']
-        bills = AccountMove.search([
-            ('agreement_id', '=', self.agreement_id.id),
-            ('move_type', 'in', ('in_invoice', 'in_refund')),
-            ('payment_state', '!=', 'paid'),
-            ('state', 'in', ('posted', 'draft')),
-        ])
-        self.write({
-            'open_bill_ids': [(6, 0, bills.ids)],
-        })
+        }
 
     @api.depends('open_bill_ids', 'open_bill_ids.amount_residual')
     def _compute_open_bills_total(self):
+        if not self:
+            return
+        bill_ids = self.open_bill_ids.ids
+        if not bill_ids:
+            self.open_bills_total = 0.0
+            return
+        # Load every residual in one query; the per-wizard sums then read from cache.
+        self.env['account.move'].search_fetch([('id', 'in', bill_ids)], ['amount_residual'])
         for wizard in self:
             wizard.open_bills_total = sum(wizard.open_bill_ids.mapped('amount_residual'))
 
@@ -211,32 +254,33 @@ class RmcAgreementSettlementWizard(models.TransientModel):
                 - (wizard.open_bills_total or 0.0)
             )
 
-    def _evaluate_hold_state(self):
-        for wizard in self:
-            reasons = wizard.agreement_id._get_settlement_blockers(
-                currency=wizard.currency_id,
-                inventory_records=wizard.inventory_handover_ids,
-            )
-            wizard.write({
-                'hold_detected': bool(reasons),
-                'hold_reason': '\n'.join(reasons) if reasons else False,
-            })
+    def _get_hold_state(self, inventory_records=None):
+        """Return ``(hold_detected, hold_reason)`` without writing anything."""
+        self.ensure_one()
+        if inventory_records is None:
+            inventory_records = self.inventory_handover_ids
+        reasons = self.agreement_id._get_settlement_blockers(
+            currency=self.currency_id,
+            inventory_records=inventory_records,
+        )
+        return bool(reasons), '\n'.join(reasons) if reasons else False
 
     def action_confirm(self):
         self.ensure_one()
         agreement = self.agreement_id
         if agreement.state != 'closure_review':
             raise ValidationError(_('Agreement must be in closure review before settlement.'))
-        self._evaluate_hold_state()
-        if self.hold_detected:
-            agreement.write({
-                'settlement_hold': True,
-                'settlement_hold_reason': self.hold_reason,
-            })
-            raise ValidationError(_('Settlement cannot proceed:\n%s') % (self.hold_reason or ''))
-        agreement.write({'settlement_hold': False, 'settlement_hold_reason': False})
-        move = self._perform_financial_action()
-        self._mark_consumed_records()
+        hold, reason = self._get_hold_state()
+        # The prefill usually stored this state already; only write what changed.
+        if (self.hold_detected, self.hold_reason) != (hold, reason):
+            self.write({'hold_detected': hold, 'hold_reason': reason})
+        if (agreement.settlement_hold, agreement.settlement_hold_reason) != (hold, reason):
+            agreement.write({'settlement_hold': hold, 'settlement_hold_reason': reason})
+        if hold:
+            raise ValidationError(_('Settlement cannot proceed:\n%s') % (reason or ''))
+        today = fields.Date.context_today(self)
+        move = self._perform_financial_action(today)
+        self._mark_consumed_records(today)
         log = self._create_settlement_log(move)
         attachment = self._generate_report_attachment()
         summary = _(
@@ -252,7 +296,7 @@ class RmcAgreementSettlementWizard(models.TransientModel):
         self._schedule_settlement_activities()
         return {'type': 'ir.actions.act_window_close'}
 
-    def _perform_financial_action(self):
+    def _perform_financial_action(self, invoice_date=None):
         self.ensure_one()
         amount = self.final_payable_amount or 0.0
         precision = self.currency_id.rounding or 0.01
@@ -279,7 +323,7 @@ class RmcAgreementSettlementWizard(models.TransientModel):
             'move_type': move_type,
             'partner_id': self.contractor_id.id,
             'agreement_id': self.agreement_id.id,
-            'invoice_date': fields.Date.context_today(self),
+            'invoice_date': invoice_date or fields.Date.context_today(self),
             'invoice_origin': self.agreement_id.name,
             'invoice_line_ids': line_vals,
         })
@@ -297,8 +341,8 @@ class RmcAgreementSettlementWizard(models.TransientModel):
             raise ValidationError(_('Please configure at least one expense account for settlement entries.'))
         return account
 
-    def _mark_consumed_records(self):
-        reference = '%s/%s' % (self.agreement_id.name, fields.Date.context_today(self))
+    def _mark_consumed_records(self, today=None):
+        reference = f'{self.agreement_id.name}/{today or fields.Date.context_today(self)}'
         if self.breakdown_event_ids:
             self.breakdown_event_ids.write({'settlement_included': True, 'settlement_reference': reference})
         if self.inventory_handover_ids:
@@ -334,11 +378,9 @@ class RmcAgreementSettlementWizard(models.TransientModel):
         report = self.env.ref('rmc_manpower_contractor.action_rmc_agreement_settlement_report', raise_if_not_found=False)
         if not report:
             return False
-        pdf_content, _ = report._render_qweb_pdf(self.ids)
-        filename = 'Settlement-%s.pdf' % (self.agreement_id.name,)
         attachment = self.env['ir.attachment'].create({
-            'name': filename,
-            'datas': base64.b64encode(pdf_content),
+            'name': 'Settlement-%s.pdf' % (self.agreement_id.name,),
+            'datas': base64.b64encode(report._render_qweb_pdf(self.ids)[0]),
             'type': 'binary',
             'res_model': 'rmc.contract.agreement',
             'res_id': self.agreement_id.id,
@@ -350,16 +392,26 @@ class RmcAgreementSettlementWizard(models.TransientModel):
         agreement = self.agreement_id
         finance_group = self.env.ref('account.group_account_user', raise_if_not_found=False)
         finance_user = finance_group.users[:1] if finance_group and finance_group.users else self.env.user
-        agreement.activity_schedule(
-            'mail.mail_activity_data_todo',
-            user_id=finance_user.id,
-            summary=_('Settlement packet ready'),
-            note=_('Please review the settlement packet for %s.') % agreement.display_name,
-        )
         owner = agreement.create_uid or self.env.user
-        agreement.activity_schedule(
-            'mail.mail_activity_data_todo',
-            user_id=owner.id,
-            summary=_('Settlement completed'),
-            note=_('Agreement %s moved to settled state.') % agreement.display_name,
-        )
+        activity_type = self.env.ref('mail.mail_activity_data_todo')
+        common_vals = {
+            'activity_type_id': activity_type.id,
+            'res_model_id': self.env['ir.model']._get_id(agreement._name),
+            'res_id': agreement.id,
+            'date_deadline': activity_type._get_date_deadline(),
+            'automated': True,
+        }
+        self.env['mail.activity'].create([
+            dict(
+                common_vals,
+                user_id=finance_user.id,
+                summary=_('Settlement packet ready'),
+                note=_('Please review the settlement packet for %s.') % agreement.display_name,
+            ),
+            dict(
+                common_vals,
+                user_id=owner.id,
+                summary=_('Settlement completed'),
+                note=_('Agreement %s moved to settled state.') % agreement.display_name,
+            ),
+        ])
@@ -1,5 +1,6 @@
-from odoo import api, fields, models
-from odoo.osv import expression
+from collections import defaultdict
+
+from odoo import api, fields, models, tools
 from odoo.exceptions import ValidationError
 
 
@@ -10,6 +11,20 @@ METRIC_TYPE_SELECTION = [
     ("selection", "Selection"),
 ]
 
+METRIC_VALUE_FIELDS = {
+    "int": "int_value",
+    "float": "float_value",
+    "text": "text_value",
+    "selection": "selection_value",
+}
+
+METRIC_DEFAULT_FIELDS = {
+    "int": "default_int_value",
+    "float": "default_float_value",
+    "text": "default_text_value",
+    "selection": "default_selection_value",
+}
+
 
 class DailyManagerReport(models.Model):
     _name = "daily.manager.report"
@@ -55,9 +70,11 @@ class DailyManagerReport(models.Model):
 
     @api.onchange("company_id")
     def _onchange_company_id(self):
-        if self.company_id and (not self.branch_id or self.branch_id != self.company_id):
+        company_id = self.company_id.id
+        if company_id and self.branch_id.id != company_id:
             self.branch_id = self.company_id
-        if self.department_id and self.department_id.company_id and self.department_id.company_id != self.company_id:
+        department_company_id = self.department_id.company_id.id
+        if department_company_id and department_company_id != company_id:
             self.department_id = False
 
     @api.onchange("manager_id")
@@ -76,111 +93,140 @@ class DailyManagerReport(models.Model):
             if record.department_id and record.department_id.company_id and record.department_id.company_id != record.company_id:
                 raise ValidationError("Department must belong to the report company.")
 
-    @api.model
+    @api.model_create_multi
     def create(self, vals_list):
-        vals_list = [vals_list] if isinstance(vals_list, dict) else vals_list
+        # Resolve the environment defaults once instead of once per report in bulk imports.
+        defaults = {}
+        if "default_company_id" not in self.env.context:
+            defaults["company_id"] = self.env.company.id
+        if "default_manager_id" not in self.env.context:
+            defaults["manager_id"] = self.env.uid
         for vals in vals_list:
             if vals.get("company_id") and not vals.get("branch_id"):
-                vals["branch_id"] = vals.get("company_id")
-        records = super().create(vals_list)
-        for report in records:
-            report._create_metric_lines_from_templates()
-            report._create_dynamic_sections_from_templates()
+                vals["branch_id"] = vals["company_id"]
+        # Merge after the branch fill so a missing branch keeps its own default.
+        vals_list = [{**defaults, **vals} for vals in vals_list]
+        if self.env.context.get("import_file"):
+            # Imported reports have no history worth logging in the chatter.
+            records = super(DailyManagerReport, self.with_context(mail_create_nolog=True)).create(vals_list)
+            records = records.with_env(self.env)
+        else:
+            records = super().create(vals_list)
+        records._create_metric_lines_from_templates()
+        records._create_dynamic_sections_from_templates()
         return records
 
+    def _group_by_template_scope(self):
+        """Group reports by their (company, branch, department) template scope."""
+        reports_by_scope = defaultdict(list)
+        for report in self:
+            reports_by_scope[(report.company_id.id, report.branch_id.id, report.department_id.id)].append(report)
+        return reports_by_scope
+
+    @staticmethod
+    def _existing_template_ids(lines):
+        """Return {report id: set of template ids} read from the lines' stored template column."""
+        existing = defaultdict(set)
+        for line in lines:
+            if line.template_id:
+                existing[line.report_id.id].add(line.template_id.id)
+        return existing
+
+    @api.model
+    def _get_template_scope_domain(self, company_id, branch_id, department_id):
+        return [
+            ("active", "=", True),
+            ("company_id", "in", [False, company_id]),
+            ("branch_id", "in", [False, branch_id]),
+            ("department_id", "in", [False, department_id]),
+        ]
+
     def _create_metric_lines_from_templates(self):
         MetricTemplate = self.env["daily.manager.metric.template"]
-        for report in self:
-            domain = expression.AND(
-                [
-                    [("active", "=", True)],
-                    ["|", ("company_id", "=", False), ("company_id", "=", report.company_id.id)],
-                    ["|", ("branch_id", "=", False), ("branch_id", "=", report.branch_id.id)],
-                    ["|", ("department_id", "=", False), ("department_id", "=", report.department_id.id)],
-                ]
+        # Freshly created reports have no lines, so this is a single empty read on create.
+        existing = self._existing_template_ids(self.metric_line_ids)
+        values = []
+        for scope, reports in self._group_by_template_scope().items():
+            templates = MetricTemplate.search_read(
+                self._get_template_scope_domain(*scope),
+                ["name", "metric_type", "sequence", *METRIC_DEFAULT_FIELDS.values()],
+                order="sequence, id",
             )
-            templates = MetricTemplate.search(domain, order="sequence, id")
-            values = []
-            existing_templates = set(report.metric_line_ids.mapped("template_id").ids)
+            line_values = []
             for template in templates:
-                if template.id in existing_templates:
-                    continue
-                values.append(
+                value_field = METRIC_VALUE_FIELDS[template["metric_type"]]
+                line_values.append(
                     {
-                        "report_id": report.id,
-                        "template_id": template.id,
-                        "name": template.name,
-                        "metric_type": template.metric_type,
-                        "sequence": template.sequence,
-                        "int_value": template.default_int_value if template.metric_type == "int" else False,
-                        "float_value": template.default_float_value if template.metric_type == "float" else False,
-                        "text_value": template.default_text_value if template.metric_type == "text" else False,
-                        "selection_value": template.default_selection_value if template.metric_type == "selection" else False,
+                        "template_id": template["id"],
+                        "name": template["name"],
+                        "metric_type": template["metric_type"],
+                        "sequence": template["sequence"],
+                        value_field: template[METRIC_DEFAULT_FIELDS[template["metric_type"]]],
                     }
                 )
-            if values:
-                self.env["daily.manager.report.metric.line"].create(values)
+            for report in reports:
+                existing_templates = existing.get(report.id, ())
+                values.extend(
+                    dict(vals, report_id=report.id)
+                    for vals in line_values
+                    if vals["template_id"] not in existing_templates
+                )
+        if values:
+            self.env["daily.manager.report.metric.line"].create(values)
 
     def _create_dynamic_sections_from_templates(self):
         SectionTemplate = self.env["daily.manager.section.template"]
-        for report in self:
-            domain = expression.AND(
-                [
-                    [("active", "=", True)],
-                    ["|", ("company_id", "=", False), ("company_id", "=", report.company_id.id)],
-                    ["|", ("branch_id", "=", False), ("branch_id", "=", report.branch_id.id)],
-                    ["|", ("department_id", "=", False), ("department_id", "=", report.department_id.id)],
-                ]
-            )
-            templates = SectionTemplate.search(domain, order="sequence, id")
-            values = []
-            existing_templates = set(report.dynamic_section_ids.mapped("template_id").ids)
-            for template in templates:
-                if template.id in existing_templates:
-                    continue
-                values.append(
-                    {
-                        "report_id": report.id,
-                        "template_id": template.id,
-                        "title": template.name,
-                        "sequence": template.sequence,
-                    }
-                )
-            if values:
-                self.env["daily.manager.report.section"].create(values)
+        existing = self._existing_template_ids(self.dynamic_section_ids)
+        values = []
+        for scope, reports in self._group_by_template_scope().items():
+            templates = SectionTemplate.search(self._get_template_scope_domain(*scope), order="sequence, id")
+            if not templates:
+                continue
+            for report in reports:
+                existing_templates = existing.get(report.id, ())
+                for template in templates:
+                    if template.id in existing_templates:
+                        continue
+                    values.append(
+                        {
+                            "report_id": report.id,
+                            "template_id": template.id,
+                            "title": template.name,
+                            "sequence": template.sequence,
+                        }
+                    )
+        if values:
+            self.env["daily.manager.report.section"].create(values)
 
     def action_submit(self):
-        for record in self:
-            if record.state != "draft":
-                continue
-            record.write(
-                {
-                    "state": "submitted",
-                    "submitted_on": fields.Datetime.now(),
-                    "submitted_by": self.env.user.id,
-                }
-            )
+        now = fields.Datetime.now()
+        uid = self.env.uid
+        self.filtered(lambda record: record.state == "draft").write(
+            {
+                "state": "submitted",
+                "submitted_on": now,
+                "submitted_by": uid,
+            }
+        )
         return True
 
     def action_reopen(self):
-        for record in self:
-            if record.state != "submitted":
-                continue
-            record.write({"state": "draft"})
+        self.filtered(lambda record: record.state == "submitted").write({"state": "draft"})
         return True
 
     def _get_allowed_notification_partners(self):
         self.ensure_one()
-        allowed_companies = {self.company_id.id}
-        if self.branch_id:
-            allowed_companies.add(self.branch_id.id)
-        partners = self.message_partner_ids.filtered(
-            lambda partner: not partner.company_id or partner.company_id.id in allowed_companies
+        allowed_companies = {self.company_id.id, self.branch_id.id} - {False}
+        followers = self.message_partner_ids
+        partner_ids = dict.fromkeys(
+            partner.id
+            for partner in followers
+            if not partner.company_id or partner.company_id.id in allowed_companies
         )
-        manager_partner = self.manager_id.partner_id
-        if manager_partner and manager_partner not in partners:
-            partners |= manager_partner
-        return partners
+        manager_partner_id = self.manager_id.partner_id.id
+        if manager_partner_id:
+            partner_ids[manager_partner_id] = None
+        return self.env["res.partner"].browse(list(partner_ids))
 
     def _get_summary_message_body(self):
         self.ensure_one()
@@ -208,19 +254,21 @@ class DailyManagerReport(models.Model):
                 )
             )
         if self.metric_line_ids:
+            lines = self.metric_line_ids.read(["name", "metric_type", *METRIC_VALUE_FIELDS.values()])
             parts.append(
                 "Metrics: "
                 + "; ".join(
-                    f"{line.name}: {line.int_value or line.float_value or line.text_value or line.selection_value or ''}"
-                    for line in self.metric_line_ids
+                    f"{line['name']}: {line.get(METRIC_VALUE_FIELDS.get(line['metric_type'])) or ''}"
+                    for line in lines
                 )
-        )
+            )
         if self.dynamic_section_ids:
+            sections = self.dynamic_section_ids.read(["title", "subject", "description"])
             parts.append(
                 "Dynamic Sections: "
                 + "; ".join(
-                    f"{section.title}: {section.subject or ''} {section.description or ''}"
-                    for section in self.dynamic_section_ids
+                    f"{section['title']}: {section['subject'] or ''} {section['description'] or ''}"
+                    for section in sections
                 )
             )
         if self.notes:
@@ -232,8 +280,8 @@ class DailyManagerReport(models.Model):
         if self.state != "submitted":
             raise ValidationError("Reports must be submitted before sending notifications.")
         template = self.env.ref("universal_daily_reporting.mail_template_daily_report_email", raise_if_not_found=False)
-        partners = self._get_allowed_notification_partners()
         compose_form = self.env.ref("mail.email_compose_message_wizard_form", raise_if_not_found=False)
+        partners = self._get_allowed_notification_partners()
         ctx = {
             "default_model": self._name,
             "default_res_id": self.id,
@@ -267,8 +315,8 @@ class DailyManagerReport(models.Model):
         if self.state != "submitted":
             raise ValidationError("Reports must be submitted before sending notifications.")
         template = self.env.ref("universal_daily_reporting.mail_template_daily_report_whatsapp", raise_if_not_found=False)
-        partners = self._get_allowed_notification_partners()
         compose_form = self.env.ref("mail.email_compose_message_wizard_form", raise_if_not_found=False)
+        partners = self._get_allowed_notification_partners()
         ctx = {
             "default_model": self._name,
             "default_res_id": self.id,
@@ -367,6 +415,16 @@ class DailyManagerSectionTemplate(models.Model):
     sequence = fields.Integer(default=10)
     description = fields.Text()
 
+    def init(self):
+        super().init()
+        # Report creation looks templates up by scope and reads them in sequence order.
+        tools.create_index(
+            self.env.cr,
+            "daily_manager_section_template_scope_idx",
+            self._table,
+            ["active", "company_id", "branch_id", "department_id", "sequence"],
+        )
+
     @api.constrains("branch_id", "company_id")
     def _check_branch_company(self):
         for template in self:
@@ -394,28 +452,48 @@ class DailyManagerReportSection(models.Model):
     partner_id = fields.Many2one("res.partner", string="Partner")
     sequence = fields.Integer(default=10)
 
-    @api.model
-    def create(self, vals):
-        template = False
-        if vals.get("template_id"):
-            template = self.env["daily.manager.section.template"].browse(vals["template_id"])
-        if template and not vals.get("title"):
-            vals["title"] = template.name
-        return super().create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        SectionTemplate = self.env["daily.manager.section.template"]
+        for vals in vals_list:
+            if vals.get("template_id") and not vals.get("title"):
+                vals["title"] = SectionTemplate.browse(vals["template_id"]).name
+        return super().create(vals_list)
 
     @api.constrains("template_id", "report_id")
     def _check_template_scope(self):
-        for line in self:
-            if not line.template_id or not line.report_id:
-                continue
-            template = line.template_id
-            report = line.report_id
-            if template.company_id and template.company_id != report.company_id:
-                raise ValidationError("Template company must match the report company.")
-            if template.branch_id and template.branch_id != report.branch_id:
-                raise ValidationError("Template branch must match the report branch.")
-            if template.department_id and template.department_id != report.department_id:
-                raise ValidationError("Template department must match the report department.")
+        if not self.ids:
+            return
+        self.flush_recordset(["template_id", "report_id"])
+        self.env["daily.manager.section.template"].flush_model(["company_id", "branch_id", "department_id"])
+        self.env["daily.manager.report"].flush_model(["company_id", "branch_id", "department_id"])
+        self.env.cr.execute(
+            """
+            SELECT t.company_id IS NOT NULL AND t.company_id IS DISTINCT FROM r.company_id,
+                   t.branch_id IS NOT NULL AND t.branch_id IS DISTINCT FROM r.branch_id,
+                   t.department_id IS NOT NULL AND t.department_id IS DISTINCT FROM r.department_id
+              FROM daily_manager_report_section l
+              JOIN daily_manager_section_template t ON t.id = l.template_id
+              JOIN daily_manager_report r ON r.id = l.report_id
+             WHERE l.id IN %s
+               AND (
+                    (t.company_id IS NOT NULL AND t.company_id IS DISTINCT FROM r.company_id)
+                 OR (t.branch_id IS NOT NULL AND t.branch_id IS DISTINCT FROM r.branch_id)
+                 OR (t.department_id IS NOT NULL AND t.department_id IS DISTINCT FROM r.department_id)
+               )
+             LIMIT 1
+            """,
+            (tuple(self.ids),),
+        )
+        mismatch = self.env.cr.fetchone()
+        if not mismatch:
+            return
+        company_mismatch, branch_mismatch, _department_mismatch = mismatch
+        if company_mismatch:
+            raise ValidationError("Template company must match the report company.")
+        if branch_mismatch:
+            raise ValidationError("Template branch must match the report branch.")
+        raise ValidationError("Template department must match the report department.")
 
 
 class DailyManagerMetricTemplate(models.Model):
@@ -443,6 +521,15 @@ class DailyManagerMetricTemplate(models.Model):
     required = fields.Boolean(string="Required", default=False)
     sequence = fields.Integer(default=10)
 
+    def init(self):
+        super().init()
+        tools.create_index(
+            self.env.cr,
+            "daily_manager_metric_template_scope_idx",
+            self._table,
+            ["active", "company_id", "branch_id", "department_id", "sequence"],
+        )
+
     @api.constrains("branch_id", "company_id")
     def _check_branch_alignment(self):
         for template in self:
@@ -473,6 +560,20 @@ class DailyManagerReportMetricLine(models.Model):
 
     @api.constrains("metric_type", "template_id")
     def _check_metric_type_alignment(self):
-        for line in self:
-            if line.template_id and line.metric_type != line.template_id.metric_type:
-                raise ValidationError("Metric line type must match the template metric type.")
+        if not self.ids:
+            return
+        self.flush_recordset(["metric_type", "template_id"])
+        self.env["daily.manager.metric.template"].flush_model(["metric_type"])
+        self.env.cr.execute(
+            """
+            SELECT l.id
+              FROM daily_manager_report_metric_line l
+              JOIN daily_manager_metric_template t ON t.id = l.template_id
+             WHERE l.id IN %s
+               AND l.metric_type <> t.metric_type
+             LIMIT 1
+            """,
+            (tuple(self.ids),),
+        )
+        if self.env.cr.fetchone():
+            raise ValidationError("Metric line type must match the template metric type.")